@@ -0,0 +1,61 @@
+# frames per second of Animate for the bundled pendulum example and a 3d scene like the solar system example
+# drawn off screen with Agg, redrawing the whole figure each frame and blitting only the animated artists
+import matplotlib
+matplotlib.use("Agg")
+import sympy as sp
+import numpy as np
+import math
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL, Animate
+from time import perf_counter
+
+m, g, l, t = sp.symbols('m, g, l, t') #constants
+a = dynamicsymbols('theta')
+Pendulum = SystemL(m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a), [a])
+times = np.linspace(0, 50, 1000)
+data = Pendulum.ODESolve([1, 0], times, [(m, 1), (l, 1), (g, 9.81)])
+
+def pendulum(): # as examples/pendulum_animated.py
+    animator = Animate(data, times, d=2)
+    animator.limits([-1.2, 1.2], [-1.2, 0.2])
+    pivot = animator.create_particle(data[0], lambda a: [0, 0], color="blue")
+    bob = animator.create_particle(data[0], lambda a: [math.sin(a[0]), -math.cos(a[0])], color="red")
+    animator.create_rod(pivot, bob)
+    animator.create_fade(bob, 20)
+    return animator
+
+def orbits(): # fading orbits in 3d as examples/solar_system.py
+    animator = Animate(data, times, d=3)
+    animator.limits([-6, 6], [-6, 6], [-1, 1])
+    centre = animator.create_particle(data[0], lambda a: [0, 0, 0], color="yellow", s=6)
+    for j in range(1, 6):
+        p = animator.create_particle(data[0], lambda a, j=j: [j*math.cos(a[1]/j), j*math.sin(a[1]/j), 0.1*math.sin(a[0])], color="C" + str(j), s=2.5)
+        animator.create_fade(p, 100)
+    animator.create_polygon(animator.particles[1:4])
+    return animator
+
+def full(animator, frames): # whole figure drawn every frame
+    for j in range(1, frames):
+        animator.update(j)
+        animator.fig.canvas.draw()
+
+def blit(animator, frames): # static background saved once, only the returned artists drawn each frame
+    canvas = animator.fig.canvas
+    artists = animator._artists()
+    for j in artists:
+        j.set_animated(True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(animator.fig.bbox)
+    for j in range(1, frames):
+        canvas.restore_region(background)
+        for k in animator.update(j):
+            k.axes.draw_artist(k)
+        canvas.blit(animator.fig.bbox)
+
+frames = 300
+for name, scene in [("pendulum", pendulum), ("3d orbits", orbits)]:
+    for mode, draw in [("full redraw", full), ("blit", blit)]:
+        animator = scene()
+        start = perf_counter()
+        draw(animator, frames)
+        print(name + ", " + mode + ": " + str(round((frames-1)/(perf_counter()-start), 1)) + " fps")
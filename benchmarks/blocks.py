@@ -0,0 +1,37 @@
+# independent double pendulums of very different lengths, so with very different time scales, derived with the matrix equation solved whole and by blocks,
+# then integrated together and with each block having its own step control
+import sympy as sp
+import numpy as np
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL, symsystem
+from time import perf_counter
+
+m, g, t = sp.symbols('m, g, t') #constants
+
+def pendulums(n): # lagrangian of n separate double pendulums, the jth with rods of length 10**j
+    L, coords = 0, []
+    for j in range(n):
+        a, b = dynamicsymbols('alpha' + str(j) + ', beta' + str(j))
+        x1, y1 = 10**j*sp.sin(a), -10**j*sp.cos(a)
+        x2, y2 = x1 + 10**j*sp.sin(b), y1 - 10**j*sp.cos(b)
+        L += m*(x1.diff(t)**2 + y1.diff(t)**2 + x2.diff(t)**2 + y2.diff(t)**2)/2 - m*g*(y1 + y2)
+        coords += [a, b]
+    return L, coords
+
+blocks = symsystem._matrixBlocks
+for n in [1, 2, 3]:
+    L, coords = pendulums(n)
+    for name, function in [("whole", lambda matrix: [(list(range(matrix.rows)), list(range(matrix.cols)))]), ("blocks", blocks)]:
+        symsystem._matrixBlocks = function
+        SystemL.derivationMemo.clear()
+        start = perf_counter()
+        System = SystemL(L, coords, simplify="cheap")
+        print(str(n) + " pendulums, solved " + name + ": " + str(round(perf_counter()-start, 3)) + " s")
+    symsystem._matrixBlocks = blocks
+    times = np.linspace(0, 100, 1001)
+    initial = [0.5, 0.2]*n + [0, 0]*n
+    for together in [False, True]:
+        System.ODESolve(initial, times[:2], [(m, 1), (g, 9.81)], method="DOP853", blocks=not together) # functions compiled before timing
+        start = perf_counter()
+        System.ODESolve(initial, times, [(m, 1), (g, 9.81)], method="DOP853", rtol=1e-10, atol=1e-10, blocks=not together)
+        print(str(n) + " pendulums, integrated " + ("together" if together else "by blocks") + ": " + str(round(perf_counter()-start, 3)) + " s, " + str(System.stats["nfev"]) + " evaluations")
@@ -0,0 +1,28 @@
+# compares the numpy and compiled C backends of funcLambdify for small systems integrated many times
+import sympy as sp
+import numpy as np
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL
+from time import perf_counter
+
+m, g, l, t = sp.symbols('m, g, l, t') #constants
+consts = [(m, 1), (l, 1), (g, 9.81)]
+a, b = dynamicsymbols('alpha, beta')
+pendulum = SystemL(m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a), [a])
+x1, y1 = l*sp.sin(a), -l*sp.cos(a)
+x2, y2 = x1 + l*sp.sin(b), y1 - l*sp.cos(b)
+double = SystemL(m*(x1.diff(t)**2 + y1.diff(t)**2 + x2.diff(t)**2 + y2.diff(t)**2)/2 - m*g*(y1 + y2), [a, b])
+
+calls = 20000
+times = np.linspace(0, 100, 1001)
+for name, System, initial in [("pendulum", pendulum, [1, 0]), ("double pendulum", double, [1, 0.5, 0, 0])]:
+    for backend in ["numpy", "c"]:
+        System.funcLambdify(consts, backend=backend)
+        y = np.array(initial, dtype=float)
+        start = perf_counter()
+        for j in range(calls):
+            System.motionApply.rhs(y, System.constantValues)
+        per_call = (perf_counter()-start)/calls
+        start = perf_counter()
+        System.ODESolve(initial, times)
+        print(name + ", " + backend + ": " + str(round(per_call*1E6, 2)) + " us per call, " + str(round(perf_counter()-start, 3)) + " s per solve")
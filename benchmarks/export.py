@@ -0,0 +1,32 @@
+# time to save the animated pendulum example as a gif, serially and with frames rendered by a pool of processes
+import matplotlib
+matplotlib.use("Agg")
+import sympy as sp
+import numpy as np
+import math, os, tempfile
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL, Animate
+from time import perf_counter
+
+m, g, l, t = sp.symbols('m, g, l, t') #constants
+a = dynamicsymbols('theta')
+Pendulum = SystemL(m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a), [a])
+times = np.linspace(0, 10, 200)
+data = Pendulum.ODESolve([1, 0], times, [(m, 1), (l, 1), (g, 9.81)])
+
+def scene(): # as examples/pendulum_animated.py
+    animator = Animate(data, times, d=2)
+    animator.limits([-1.2, 1.2], [-1.2, 0.2])
+    pivot = animator.create_particle(data[0], lambda a: [0, 0], color="blue")
+    bob = animator.create_particle(data[0], lambda a: [math.sin(a[0]), -math.cos(a[0])], color="red")
+    animator.create_rod(pivot, bob)
+    animator.create_fade(bob, 20)
+    return animator
+
+folder = tempfile.mkdtemp()
+workers = 1
+while workers <= max(2, os.cpu_count()):
+    start = perf_counter()
+    scene().savegif(os.path.join(folder, "pendulum"), 20, workers=workers)
+    print(str(workers) + (" worker (serial)" if workers == 1 else " workers") + ": " + str(round(perf_counter()-start, 2)) + " s")
+    workers *= 2
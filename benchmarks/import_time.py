@@ -0,0 +1,26 @@
+# time taken to import symphysics, and to use each part of it, in a fresh interpreter
+# the heavy dependencies should only be imported by the parts which need them
+import subprocess, sys
+
+repeats = 5
+cases = [("import symphysics", "import symphysics"),
+         ("SystemL", "import symphysics; symphysics.SystemL"),
+         ("Animate", "import symphysics; symphysics.Animate"),
+         ("from symphysics import *", "from symphysics import *")]
+check = "; import sys; print(sorted(j for j in ['sympy', 'scipy', 'matplotlib', 'dill'] if j in sys.modules))"
+
+def topLevel(stderr): # total microseconds of the top level imports
+    total = 0
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            total += int(parts[1])
+    return total
+
+for name, code in cases:
+    best = None
+    for j in range(repeats): # -X importtime reports cumulative microseconds per module on stderr
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code + check], capture_output=True, text=True)
+        total = topLevel(result.stderr)
+        best = total if best == None else min(best, total)
+    print(name + ": " + str(round(best/1E3)) + " ms, imports " + ", ".join(eval(result.stdout)))
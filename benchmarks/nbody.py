@@ -0,0 +1,17 @@
+# time of one force evaluation of SystemN summing every pair directly and with the Barnes-Hut tree, and the error of the tree
+import numpy as np
+from symphysics import SystemN
+from time import perf_counter
+
+rng = np.random.default_rng(0)
+for n in [100, 500, 1000, 2000, 4000, 8000, 16000]:
+    positions = rng.normal(size=(n, 3))
+    system = SystemN(np.ones(n), G=1/n, softening=0.01)
+    results = {}
+    for force in ["direct", "tree"]:
+        system.force = force
+        start = perf_counter()
+        results[force] = system.accelerations(positions)
+        results[force + " time"] = perf_counter()-start
+    error = np.linalg.norm(results["tree"] - results["direct"], axis=1)/np.linalg.norm(results["direct"], axis=1)
+    print(str(n) + " bodies: direct " + str(round(results["direct time"], 4)) + " s, tree " + str(round(results["tree time"], 4)) + " s, tree median relative error " + str(round(np.median(error), 5)))
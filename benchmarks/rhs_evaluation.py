@@ -0,0 +1,35 @@
+# compares the time per integrator step of the per-equation lambdas against the single vectorized function
+# uses the solar system lagrangian from examples/solar_system.py - 5 bodies orbiting a fixed sun, 15 coordinates
+import sympy as sp
+from sympy import sqrt
+import numpy as np
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL
+from time import perf_counter
+
+bodies = 5
+steps = 2000
+
+M, G, t = sp.symbols('M, G, t') #constants
+consts = [(G, 6.67408E-11), (M, 1.98850E+30)]
+coords = []
+L = 0
+for j in range(bodies):
+    m = sp.Symbol("m_" + str(j))
+    x,y,z = dynamicsymbols("x_" + str(j) + ", y_" + str(j) + ", z_" + str(j))
+    L += m*(x.diff(t)**2+y.diff(t)**2+z.diff(t)**2)/2 + G*m*M/sqrt(x**2+y**2+z**2)
+    consts.append((m, 10**24*(j+1)))
+    coords += [x,y,z]
+
+System = SystemL(L, coords)
+state = np.random.default_rng(0).uniform(1E11, 1E12, 2*len(coords))
+
+results = {}
+for vectorize in [False, True]:
+    System.funcLambdify(consts, vectorize=vectorize)
+    start = perf_counter()
+    for j in range(steps):
+        System._eval(state, 0)
+    results[vectorize] = (perf_counter()-start)/steps
+    print(("vectorized" if vectorize else "per-equation") + ": " + str(round(results[vectorize]*1E6, 2)) + " us per step")
+print("speedup: " + str(round(results[False]/results[True], 2)) + "x")
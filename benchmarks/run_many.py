@@ -0,0 +1,31 @@
+# solves a parameter study of double pendulums serially and with runMany for increasing numbers of workers
+import sympy as sp
+import numpy as np
+import os
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL
+from time import perf_counter
+
+m, g, l, t = sp.symbols('m, g, l, t') #constants
+a, b = dynamicsymbols('alpha, beta')
+x1, y1 = l*sp.sin(a), -l*sp.cos(a)
+x2, y2 = x1 + l*sp.sin(b), y1 - l*sp.cos(b)
+System = SystemL(m*(x1.diff(t)**2 + y1.diff(t)**2 + x2.diff(t)**2 + y2.diff(t)**2)/2 - m*g*(y1 + y2), [a, b], simplify="cheap")
+System.funcLambdify([]) # g, l and m given with each task
+
+if __name__ == "__main__":
+    times = np.linspace(0, 50, 5001)
+    tasks = [([1, 0.5, 0, 0], [g_value, 1, 1], times) for g_value in np.linspace(1, 20, 64)]
+    start = perf_counter()
+    for initial, constants, task_times in tasks:
+        System.ODESolve(initial, task_times, constants)
+    serial = perf_counter()-start
+    print("serial: " + str(round(serial, 3)) + " s")
+    workers = 1
+    while workers <= os.cpu_count():
+        start = perf_counter()
+        for index, data in System.runMany(tasks, workers=workers):
+            pass
+        elapsed = perf_counter()-start
+        print(str(workers) + " workers: " + str(round(elapsed, 3)) + " s, speedup " + str(round(serial/elapsed, 2)))
+        workers *= 2
@@ -0,0 +1,30 @@
+# time to convert the functions of a system to symbols for saving, and back when loading, as the number of coordinates grows
+import sympy as sp
+from sympy.calculus.euler import euler_equations
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL
+from time import perf_counter
+
+m, g, l, t = sp.symbols('m, g, l, t') #constants
+
+def chain(n): # lagrangian and euler lagrange equations of a chain of n pendulums, not simplified or solved
+    q = dynamicsymbols('q0:' + str(n))
+    x = y = T = V = 0
+    for j in q:
+        x += l*sp.sin(j)
+        y -= l*sp.cos(j)
+        T += m*(x.diff(t)**2 + y.diff(t)**2)/2
+        V += m*g*y
+    return q, T - V, euler_equations(T - V, q, t)
+
+for n in [2, 4, 8, 16, 32]:
+    q, L, eqs = chain(n)
+    funcs = [list(q), [j.diff(t) for j in q], eqs, [], [L]]
+    start = perf_counter()
+    converted, conversions = SystemL._convertFunctions([list(j) for j in funcs])
+    convert = perf_counter()-start
+    start = perf_counter()
+    loaded = SystemL._loadFunctions(converted, conversions)
+    load = perf_counter()-start
+    assert loaded == funcs
+    print(str(n) + " coordinates: convert " + str(round(convert, 3)) + " s, load " + str(round(load, 3)) + " s")
@@ -0,0 +1,144 @@
+# benchmark suite of the bundled systems, timing derivation, lambdification, integration, saving and loading, and animation
+# results are written as JSON so that runs, e.g. of two releases, can be compared with --compare
+#   python benchmarks/suite.py --output before.json
+#   python benchmarks/suite.py --output after.json --compare before.json
+import matplotlib
+matplotlib.use("Agg")
+import sympy as sp
+import numpy as np
+import argparse, json, math, os, platform, subprocess, sys, tempfile, time
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL, Animate
+from time import perf_counter
+
+m, g, l, t, G, M = sp.symbols('m, g, l, t, G, M') #constants
+
+def pendulum(): # as examples/pendulum.py
+    a = dynamicsymbols('theta')
+    L = m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a)
+    conv = lambda a: [math.sin(a[0]), -math.cos(a[0])]
+    return L, [a], [(m, 1), (l, 1), (g, 9.81)], [1, 0], np.linspace(0, 50, 1001), [conv], 2
+
+def double_pendulum():
+    a, b = dynamicsymbols('alpha, beta')
+    x1, y1 = l*sp.sin(a), -l*sp.cos(a)
+    x2, y2 = x1 + l*sp.sin(b), y1 - l*sp.cos(b)
+    L = m*(x1.diff(t)**2 + y1.diff(t)**2 + x2.diff(t)**2 + y2.diff(t)**2)/2 - m*g*(y1 + y2)
+    convs = [lambda a: [math.sin(a[0]), -math.cos(a[0])], lambda a: [math.sin(a[0]) + math.sin(a[1]), -math.cos(a[0]) - math.cos(a[1])]]
+    return L, [a, b], [(m, 1), (l, 1), (g, 9.81)], [1, 0.5, 0, 0], np.linspace(0, 50, 1001), convs, 2
+
+def solar_system(bodies): # as examples/solar_system.py, with bodies on inclined circular orbits of radius 1 to bodies around a fixed sun
+    L = 0
+    coords, positions, velocities, constants, convs = [], [], [], [(G, 1), (M, 1)], []
+    for j in range(bodies):
+        mass = sp.Symbol("m_" + str(j))
+        x, y, z = dynamicsymbols("x_" + str(j) + ", y_" + str(j) + ", z_" + str(j))
+        L += mass*(x.diff(t)**2 + y.diff(t)**2 + z.diff(t)**2)/2 + G*mass*M/sp.sqrt(x**2 + y**2 + z**2)
+        coords += [x, y, z]
+        radius = j + 1
+        positions += [radius, 0, 0]
+        velocities += [0, math.cos(0.1*j)/math.sqrt(radius), math.sin(0.1*j)/math.sqrt(radius)]
+        constants.append((mass, 1e-3))
+        convs.append(lambda a, j=j: [a[3*j], a[3*j+1], a[3*j+2]])
+    return L, coords, constants, positions + velocities, np.linspace(0, 100, 1001), convs, 3
+
+def best(function, repeats): # minimum time of repeated calls, the least affected by anything else running
+    times = []
+    for j in range(repeats):
+        start = perf_counter()
+        function()
+        times.append(perf_counter()-start)
+    return min(times)
+
+def animation(data, times, convs, d, frames): # frames per second drawing off screen, each particle with a fading trail
+    animator = Animate(data, times, d=d)
+    if d == 2:
+        animator.limits([-2.2, 2.2], [-2.2, 2.2])
+    else:
+        animator.limits([-len(convs)-1, len(convs)+1], [-len(convs)-1, len(convs)+1], [-1, 1])
+    for j in convs:
+        animator.create_fade(animator.create_particle(data[0], j), 20)
+    animator.fig.canvas.draw()
+    start = perf_counter()
+    for j in range(1, frames):
+        animator.update(j % len(data))
+        animator.fig.canvas.draw()
+    return (frames-1)/(perf_counter()-start)
+
+def run(name, system, repeats, frames, folder): # results of one system
+    L, coords, constants, initial, times, convs, d = system
+    result = {"coordinates": len(coords)}
+    def update():
+        SystemL.derivationMemo.clear() # derive from scratch every time
+        return SystemL(L, coords)
+    result["update"] = best(update, repeats)
+    System = update()
+    def lambdify():
+        System.lambdaCache.clear() # generate the code every time
+        System.funcLambdify(constants)
+    result["funcLambdify"] = best(lambdify, repeats)
+    data = System.ODESolve(initial, times, constants)
+    result["ODESolve"] = best(lambda: System.ODESolve(initial, times, constants), repeats)
+    result["ODESolve_nfev"] = System.stats["nfev"]
+    result["ODESolve_per_step"] = result["ODESolve"]/(len(times)-1) # per output time
+    result["ODESolve_per_evaluation"] = result["ODESolve"]/System.stats["nfev"]
+    filename = os.path.join(folder, name)
+    result["saveSystem"] = best(lambda: SystemL.saveSystem(System, filename), repeats)
+    def load(): # every section read, not just the table of contents
+        loaded = SystemL.loadSystem(filename)
+        loaded.motionApply, loaded.data
+        return loaded
+    result["loadSystem"] = best(load, repeats)
+    result["Animate_fps"] = animation(data, times, convs, d, frames)
+    print(name + ": " + ", ".join(j + " " + ("{:.4g}".format(k) if isinstance(k, float) else str(k)) for j, k in result.items()))
+    return result
+
+def environment(): # versions and machine, so that results are only compared like for like
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(), "numpy": np.__version__, "sympy": sp.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+def compare(results, baseline, threshold): # ratio of each time to the baseline, returns the number of regressions
+    regressions = 0
+    print("\ncompared with " + str(baseline["environment"]["commit"]) + " from " + baseline["environment"]["date"])
+    for name, result in results.items():
+        for key, value in result.items():
+            old = baseline["results"].get(name, {}).get(key)
+            if old == None or key in ["coordinates", "ODESolve_nfev"] or not old or not value:
+                continue
+            ratio = old/value if key.endswith("_fps") else value/old # above 1 is slower for every measurement
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif ratio < 1/threshold:
+                flag = "  improved"
+            print(name + " " + key + ": " + str(round(ratio, 2)) + "x" + flag)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="symphysics benchmark suite")
+    parser.add_argument("--bodies", type=int, default=3, help="bodies in the solar system")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of each measurement, the fastest is kept")
+    parser.add_argument("--frames", type=int, default=100, help="frames drawn to measure Animate")
+    parser.add_argument("--systems", nargs="+", default=["pendulum", "double_pendulum", "solar_system"])
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown relative to --compare counted as a regression")
+    args = parser.parse_args()
+    systems = {"pendulum": pendulum, "double_pendulum": double_pendulum, "solar_system": lambda: solar_system(args.bodies)}
+    folder = tempfile.mkdtemp()
+    results = {}
+    for name in args.systems:
+        results[name] = run(name, systems[name](), args.repeats, args.frames, folder)
+    output = {"environment": environment(), "settings": {"bodies": args.bodies, "repeats": args.repeats, "frames": args.frames}, "results": results}
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(output, outfile, indent=2)
+    if args.compare:
+        with open(args.compare) as infile:
+            if compare(results, json.load(infile), args.threshold):
+                sys.exit(1)
@@ -0,0 +1,31 @@
+# compares wall time against energy drift for a long run of a separable system
+# a planet in an eccentric orbit around a fixed sun, as in examples/solar_system.py, for 1000 orbits
+import sympy as sp
+from sympy import sqrt
+import numpy as np
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL
+from time import perf_counter
+
+orbits = 1000
+samples = 20 # output points per orbit
+
+GM, t = sp.symbols('GM, t') #constants
+x, y = dynamicsymbols('x, y')
+L = (x.diff(t)**2 + y.diff(t)**2)/2 + GM/sqrt(x**2 + y**2)
+consts = [(GM, 4*np.pi**2)] # units of AU and years, period of 1 for semi-major axis of 1
+System = SystemL(L, [x, y])
+print("separable: " + str(System.isSeparable()))
+
+e = 0.2 # eccentricity, start at perihelion
+initials = [1-e, 0, 0, 2*np.pi*np.sqrt((1+e)/(1-e))]
+times = np.linspace(0, orbits, orbits*samples+1)
+
+runs = [("odeint", {"rtol": 1e-6, "atol": 1e-6}), ("odeint", {"rtol": 1e-9, "atol": 1e-9}), ("DOP853", {"rtol": 1e-9, "atol": 1e-9}),
+        ("verlet", {"substeps": 10}), ("verlet", {"substeps": 40}), ("yoshida4", {"substeps": 10}), ("yoshida6", {"substeps": 5})]
+print("method, options, wall time (s), steps, max relative energy drift")
+for method, options in runs:
+    data = System.ODESolve(initials, times, consts, method=method, **options)
+    energy = System.energy()
+    drift = np.max(np.abs((energy-energy[0])/energy[0]))
+    print(method + ", " + str(options) + ", " + str(round(System.stats["wall_time"], 3)) + ", " + str(System.stats["nsteps"]) + ", " + "{:.2e}".format(drift))
@@ -0,0 +1,20 @@
+# time per frame to update traces and fades of increasing length, without drawing
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import math
+from symphysics import Animate
+from time import perf_counter
+
+times = np.linspace(0, 100, 3000)
+data = times[:, None]
+
+for length in [50, 500, 5000]:
+    for kind in ["trace", "fade"]:
+        animator = Animate(data, times, d=3)
+        p = animator.create_particle(data[0], lambda a: [math.cos(a[0]), math.sin(a[0]), 0.01*a[0]])
+        getattr(animator, "create_" + kind)(p, length)
+        start = perf_counter()
+        for j in range(1, len(times)):
+            animator.update(j)
+        print(kind + ", length " + str(length) + ": " + str(round((perf_counter()-start)/(len(times)-1)*1E6, 1)) + " us per frame")
@@ -0,0 +1,33 @@
+# time spent updating the objects of Animate each frame, without drawing, for a scene of many particles with traces
+# conversion functions called on each state, or vectorized and called once on the whole data before rendering
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import math
+from symphysics import Animate
+from time import perf_counter
+
+n = 300 # particles, each on a circle of radius j at angular speed 1/j
+times = np.linspace(0, 100, 2000)
+data = times[:, None]*np.ones(n)
+
+def scene(vectorized):
+    animator = Animate(data, times, d=2)
+    for j in range(1, n+1):
+        if vectorized:
+            conv = lambda a, j=j: np.stack((j*np.cos(a[:, j-1]/j), j*np.sin(a[:, j-1]/j)), axis=1)
+        else:
+            conv = lambda a, j=j: [j*math.cos(a[j-1]/j), j*math.sin(a[j-1]/j)]
+        p = animator.create_particle(data[0], conv, s=2, vectorized=vectorized)
+        animator.create_trace(p, 50)
+    return animator
+
+for vectorized in [False, True]:
+    start = perf_counter()
+    animator = scene(vectorized)
+    setup = perf_counter()-start
+    start = perf_counter()
+    for j in range(1, len(times)):
+        animator.update(j)
+    per_frame = (perf_counter()-start)/(len(times)-1)
+    print(("vectorized" if vectorized else "per state") + ": setup " + str(round(setup, 2)) + " s, " + str(round(per_frame*1E3, 2)) + " ms per frame")
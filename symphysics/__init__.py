@@ -1,5 +1,24 @@
 # Version of the realpython-reader package
 __version__ = "0.1.0"
 
-from symphysics.symsystem import *
-from symphysics.sprites import *
+import importlib
+
+# submodules are imported when one of their names is first used (PEP 562), so that e.g. a worker which only
+# integrates systems never imports matplotlib
+_LAZY = {"SystemL": "symsystem", "t": "symsystem",
+         "Animate": "sprites", "Particle": "sprites", "Rod": "sprites", "Spring": "sprites", "Trace": "sprites", "Fade": "sprites", "Polygon": "sprites", "Polyhedra": "sprites",
+         "EquationCache": "cache", "cacheDirectory": "cache",
+         "Trajectory": "storage",
+         "SystemN": "nbody"}
+
+__all__ = list(_LAZY)
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module("symphysics." + _LAZY[name]), name)
+        globals()[name] = value # later lookups don't go through __getattr__
+        return value
+    raise AttributeError("module 'symphysics' has no attribute '" + name + "'")
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,63 @@
+#IMPORTS
+import sympy as sp
+import hashlib, os, pathlib, pickle
+
+def cacheDirectory(): # default location of cached files, can be set by environment variable
+    return pathlib.Path(os.environ.get("SYMPHYSICS_CACHE", pathlib.Path.home() / ".cache" / "symphysics"))
+
+class EquationCache():
+    # stores derived equations of motion on disk, keyed by a hash of everything they were derived from
+    # files are removed least recently used first once the total size exceeds maxsize bytes
+    def __init__(self, path=None, maxsize=256*2**20):
+        if path == None:
+            path = cacheDirectory()
+        self.path = pathlib.Path(path)
+        self.maxsize = maxsize
+
+    @staticmethod
+    def key(*parts): # canonical hash of sympy expressions, lists of expressions and flags
+        return hashlib.sha256(("symphysics-1:" + sp.srepr(list(parts))).encode()).hexdigest()
+
+    def get(self, key): # returns None if not stored
+        filename = self.path / (key + ".pkl")
+        try:
+            with open(filename, 'rb') as infile:
+                stored = pickle.load(infile)
+        except FileNotFoundError:
+            return None
+        except Exception: # unreadable e.g. partially written or from an incompatible version
+            self.invalidate(key)
+            return None
+        os.utime(filename) # mark as recently used
+        return stored
+
+    def put(self, key, value):
+        self.path.mkdir(parents=True, exist_ok=True)
+        filename = self.path / (key + ".pkl")
+        temp = self.path / (key + "." + str(os.getpid()) + ".tmp")
+        with open(temp, 'wb') as outfile:
+            pickle.dump(value, outfile)
+        os.replace(temp, filename) # atomic so other processes never see a partial file
+        self._evict()
+
+    def invalidate(self, key): # remove a single entry
+        try:
+            os.remove(self.path / (key + ".pkl"))
+        except FileNotFoundError:
+            pass
+
+    def clear(self): # remove all entries
+        for j in self.path.glob("*.pkl"):
+            j.unlink()
+
+    def size(self): # total size of entries in bytes
+        return sum(j.stat().st_size for j in self.path.glob("*.pkl"))
+
+    def _evict(self):
+        entries = sorted(((j.stat().st_mtime, j.stat().st_size, j) for j in self.path.glob("*.pkl")), key=lambda j: j[0])
+        total = sum(j[1] for j in entries)
+        for mtime, size, filename in entries: # oldest first
+            if total <= self.maxsize:
+                break
+            filename.unlink()
+            total -= size
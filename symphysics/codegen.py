@@ -0,0 +1,107 @@
+#IMPORTS
+import sympy as sp
+import numpy as np
+import ctypes, hashlib, os, shutil, subprocess, tempfile, warnings
+from symphysics.cache import cacheDirectory
+from symphysics.symsystem import _VectorFunction
+
+class CompileError(Exception):
+    pass
+
+class _CFunction():
+    # evaluates a list of expressions with C code compiled by the local C compiler, called through ctypes
+    # arguments and results are laid out as for _VectorFunction, so it can be used in its place
+    # built libraries are cached on disk keyed by a hash of the source, so each is only compiled once
+    def __init__(self, args, expressions, name="_vector", shape=None):
+        self.name = name
+        self.shape = (len(expressions),) if shape == None else tuple(shape)
+        self.nargs = len(args)
+        self.fallback = _VectorFunction(args, expressions, name, shape) # numpy version if the library can't be loaded
+        symbols = [sp.Symbol("y_" + str(j)) for j in range(len(args))]
+        expressions = [sp.sympify(j).xreplace(dict(zip(args, symbols))) for j in expressions]
+        replacements, reduced = sp.cse(expressions, symbols=sp.numbered_symbols("x_"))
+        lines = ["#include <math.h>", "void " + name + "(long n, const double *in, double *out) {", "    for (long k = 0; k < n; k++) {"]
+        for num, symbol in enumerate(symbols): # arguments stored as rows of n points
+            lines.append("        const double " + str(symbol) + " = in[" + str(num) + "*n + k];")
+        for symbol, expr in replacements:
+            lines.append("        const double " + str(symbol) + " = " + sp.ccode(expr, standard="c99") + ";")
+        for num, expr in enumerate(reduced):
+            lines.append("        out[" + str(num) + "*n + k] = " + sp.ccode(expr, standard="c99") + ";")
+        lines += ["    }", "}", ""]
+        self.source = "\n".join(lines)
+        self._load()
+
+    def __call__(self, *args):
+        if self.func == None: # library couldn't be loaded
+            return self.fallback(*args)
+        try: # single point, use preallocated buffers
+            self._in[:] = args
+        except (ValueError, TypeError):
+            return self._callMany(args)
+        self.func(1, self._inAddress, self._outAddress)
+        return self._out.copy()
+
+    def rhs(self, y, params): # low overhead evaluation at a single state y with constants params
+        if self.func == None:
+            return self.fallback.rhs(y, params)
+        self._in[:len(y)] = y
+        self._in[len(y):] = params
+        self.func(1, self._inAddress, self._outAddress)
+        return self._out.copy()
+
+    def _callMany(self, args):
+        try: # all the same shape
+            values = np.array(args, dtype=float)
+        except ValueError: # broadcast e.g. scalar constants with a batch of states
+            values = np.empty((len(args),) + np.broadcast_shapes(*[np.shape(j) for j in args]))
+            for num, j in enumerate(args):
+                values[num] = j
+        values = np.ascontiguousarray(values) # one row of points per argument
+        shape = values.shape[1:]
+        out = np.empty(self.shape + shape)
+        self.func(values[0].size, values.ctypes.data, out.ctypes.data)
+        return out
+
+    def _load(self): # compile if not cached, then load the library
+        key = hashlib.sha256(self.source.encode()).hexdigest()
+        directory = cacheDirectory() / "compiled"
+        library = directory / (key + ".so")
+        if not library.exists():
+            compiler = os.environ.get("CC", "cc")
+            if shutil.which(compiler) == None:
+                raise CompileError("no C compiler found, set the CC environment variable")
+            directory.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=directory) as build:
+                source = os.path.join(build, self.name + ".c")
+                with open(source, 'w') as outfile:
+                    outfile.write(self.source)
+                result = subprocess.run([compiler, "-O2", "-shared", "-fPIC", "-o", os.path.join(build, "lib.so"), source, "-lm"], capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise CompileError("compiling failed:\n" + result.stderr)
+                os.replace(os.path.join(build, "lib.so"), library) # atomic so other processes never load a partial file
+        self.library = ctypes.CDLL(str(library))
+        self.func = getattr(self.library, self.name)
+        self.func.argtypes = [ctypes.c_long, ctypes.c_void_p, ctypes.c_void_p]
+        self.func.restype = None
+        self._in = np.empty(self.nargs) # buffers for single points
+        self._out = np.empty(self.shape)
+        self._inAddress = self._in.ctypes.data
+        self._outAddress = self._out.ctypes.data
+
+    def __getstate__(self): # only store the source, library is loaded from the cache or recompiled on load
+        return {"name": self.name, "shape": self.shape, "nargs": self.nargs, "source": self.source, "fallback": self.fallback}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            self._load()
+        except (CompileError, OSError) as error: # e.g. no compiler on this machine
+            warnings.warn("could not load compiled functions, using numpy instead: " + str(error))
+            self.func = None
+
+def compiledFunction(args, expressions, name="_vector", shape=None): # C function if it can be compiled, numpy otherwise
+    try:
+        return _CFunction(args, expressions, name, shape)
+    except (CompileError, OSError) as error:
+        warnings.warn("could not compile functions, using numpy instead: " + str(error))
+        return _VectorFunction(args, expressions, name, shape)
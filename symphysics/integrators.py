@@ -0,0 +1,124 @@
+#IMPORTS
+import numpy as np
+
+# integrators acting on a batch of states at once
+# f takes an array of states with shape (batch, n) and returns their time derivatives in the same shape
+# all integrators return an array of shape (time, batch, n)
+
+def rk4(f, initial, times, substeps=1): # classic fixed step runge-kutta, substeps steps between each output time
+    y = np.array(initial, dtype=float)
+    data = np.empty((len(times),) + y.shape)
+    data[0] = y
+    for j in range(1, len(times)):
+        h = (times[j]-times[j-1])/substeps
+        for _ in range(substeps):
+            k1 = f(y)
+            k2 = f(y + h/2*k1)
+            k3 = f(y + h/2*k2)
+            k4 = f(y + h*k3)
+            y = y + h/6*(k1 + 2*k2 + 2*k3 + k4)
+        data[j] = y
+    return data
+
+#Dormand-Prince 5(4) coefficients
+_DP_A = [[],
+         [1/5],
+         [3/40, 9/40],
+         [44/45, -56/15, 32/9],
+         [19372/6561, -25360/2187, 64448/6561, -212/729],
+         [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+         [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+_DP_E = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40] # difference between 5th and 4th order weights
+
+def rk45(f, initial, times, rtol=1e-6, atol=1e-9, max_steps=10**6): # adaptive Dormand-Prince, one step size shared by the whole batch
+    y = np.array(initial, dtype=float)
+    data = np.empty((len(times),) + y.shape)
+    data[0] = y
+    direction = 1 if len(times) < 2 or times[-1] >= times[0] else -1 # integrates backwards for decreasing times
+    if np.any(direction*np.diff(times) < 0):
+        raise Exception("times should be monotonically increasing or decreasing")
+    k1 = f(y)
+    scale = atol + rtol*np.abs(y) # estimate of a sensible first step
+    d0 = np.sqrt(np.mean((y/scale)**2))
+    d1 = np.sqrt(np.mean((k1/scale)**2))
+    h = 0.01*d0/d1 if d0 > 1e-5 and d1 > 1e-5 else 1e-6 # size of the next step, signed by direction when taken
+    h = min(h, abs(times[-1]-times[0])) if len(times) > 1 else h
+    steps = 0
+    t_local = times[0]
+    for j in range(1, len(times)):
+        while direction*(times[j]-t_local) > 0:
+            steps += 1
+            if steps > max_steps:
+                raise Exception("maximum number of steps exceeded at t = " + str(t_local))
+            clipped = h >= direction*(times[j]-t_local) # land exactly on the output time
+            step = times[j]-t_local if clipped else direction*h
+            ks = [k1]
+            for stage in range(1, 7):
+                ks.append(f(y + step*sum(a*k for a, k in zip(_DP_A[stage], ks) if a != 0)))
+            y_new = y + step*sum(a*k for a, k in zip(_DP_A[6], ks) if a != 0)
+            error = step*sum(e*k for e, k in zip(_DP_E, ks) if e != 0)
+            scale = atol + rtol*np.maximum(np.abs(y), np.abs(y_new))
+            norm = np.max(np.sqrt(np.mean((error/scale)**2, axis=-1))) # worst member of the batch controls the step
+            factor = min(5, max(0.2, 0.9*norm**-0.2)) if norm > 0 else 5
+            if norm <= 1: # accept step
+                t_local = times[j] if clipped else t_local + step
+                y = y_new
+                k1 = ks[6] # first same as last
+                h = max(h, abs(step)*factor) if clipped else abs(step)*factor # a shortened step shouldn't shrink the next one
+            else:
+                h = abs(step)*factor
+        data[j] = y
+    return data
+
+# symplectic integrators for systems where the accelerations depend only on the coordinates
+# accel takes an array of coordinates with shape (batch, n) and returns their accelerations in the same shape
+# states are coordinates followed by velocities, as for the other integrators
+
+#weights of leapfrog steps composed into higher order methods, from Yoshida 1990
+_YOSHIDA_4 = [1/(2-2**(1/3)), -2**(1/3)/(2-2**(1/3)), 1/(2-2**(1/3))]
+_YOSHIDA_6_W = [-1.17767998417887100694641568, 0.235573213359358133684793182, 0.784513610477557263819497633]
+_YOSHIDA_6 = _YOSHIDA_6_W + [1-2*sum(_YOSHIDA_6_W)] + _YOSHIDA_6_W[::-1]
+
+def verlet(accel, initial, times, substeps=1): # velocity verlet (kick-drift-kick leapfrog), 2nd order
+    return _compose(accel, initial, times, substeps, [1])
+
+def leapfrog(accel, initial, times, substeps=1): # drift-kick-drift leapfrog, 2nd order
+    y = np.array(initial, dtype=float)
+    n = y.shape[-1]//2
+    q, v = y[..., :n], y[..., n:]
+    data = np.empty((len(times),) + y.shape)
+    data[0] = y
+    for j in range(1, len(times)):
+        h = (times[j]-times[j-1])/substeps
+        for _ in range(substeps):
+            q = q + h/2*v
+            v = v + h*accel(q)
+            q = q + h/2*v
+        data[j, ..., :n] = q
+        data[j, ..., n:] = v
+    return data
+
+def yoshida4(accel, initial, times, substeps=1): # 4th order, 3 acceleration evaluations per step
+    return _compose(accel, initial, times, substeps, _YOSHIDA_4)
+
+def yoshida6(accel, initial, times, substeps=1): # 6th order, 7 acceleration evaluations per step
+    return _compose(accel, initial, times, substeps, _YOSHIDA_6)
+
+def _compose(accel, initial, times, substeps, weights): # velocity verlet steps of size weight*h in turn
+    y = np.array(initial, dtype=float)
+    n = y.shape[-1]//2
+    q, v = y[..., :n], y[..., n:]
+    a = accel(q)
+    data = np.empty((len(times),) + y.shape)
+    data[0] = y
+    for j in range(1, len(times)):
+        h = (times[j]-times[j-1])/substeps
+        for _ in range(substeps):
+            for w in weights:
+                v = v + w*h/2*a
+                q = q + w*h*v
+                a = accel(q) # reused for the first kick of the next step
+                v = v + w*h/2*a
+        data[j, ..., :n] = q
+        data[j, ..., n:] = v
+    return data
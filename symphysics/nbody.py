@@ -0,0 +1,197 @@
+#IMPORTS
+import numpy as np
+from symphysics import integrators
+from time import perf_counter
+
+class SystemN():
+    # gravitating point masses, integrated numerically without deriving symbolic equations of motion
+    # states are laid out as for a SystemL with coordinates x0, y0, (z0,) x1, y1, ... so data, times, Animate and saveSystem work the same
+    def __init__(self, masses=None, G=1, softening=0, d=3, force="auto", theta=0.5, threshold=3000):
+        self.masses = np.asarray(masses, dtype=float) if masses is not None else None # mass of each body
+        self.G = G # gravitational constant
+        self.softening = softening # plummer softening length, removes the singularity of close encounters
+        self.d = d # dimensions, 2 or 3
+        self.force = force # "direct", "tree" or "auto" to choose by the number of bodies
+        self.theta = theta # opening angle of the Barnes-Hut tree, smaller is more accurate and slower
+        self.threshold = threshold # number of bodies from which "auto" uses the tree
+        self.data = None
+        self.times = None
+        self.stats = None
+        if force not in ["auto", "direct", "tree"]:
+            raise Exception("unknown force " + str(force) + ", should be 'auto', 'direct' or 'tree'")
+
+    def __getstate__(self): # pickled for .lag files without the data, which is stored in a trajectory
+        state = self.__dict__.copy()
+        for j in ["data", "times", "trajectory"]:
+            state.pop(j, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.data = None
+        self.times = None
+
+    def __len__(self): # number of bodies
+        return len(self.masses)
+
+    def accelerations(self, positions): # accelerations of every body, positions has one row per body
+        return self._forces(np.asarray(positions, dtype=float).reshape(len(self), self.d))[0]
+
+    def potentials(self, positions): # gravitational potential at every body due to all the others
+        return self._forces(np.asarray(positions, dtype=float).reshape(len(self), self.d), potential=True)[1]
+
+    def _useTree(self):
+        return self.force == "tree" or (self.force == "auto" and len(self) >= self.threshold)
+
+    def _forces(self, q, potential=False): # (accelerations, potentials or None) with q of shape (bodies, d)
+        if self._useTree():
+            return self._barnesHut(q, potential)
+        return self._direct(q, potential)
+
+    def _direct(self, q, potential=False): # every pair, O(N^2), in blocks of rows to limit memory
+        n = len(q)
+        acc = np.empty_like(q)
+        phi = np.empty(n) if potential else None
+        block = max(1, 2**20//n)
+        for start in range(0, n, block):
+            rows = np.arange(start, min(start+block, n))
+            diff = q[None, :, :] - q[rows, None, :] # from each body of the block to every body
+            r2 = np.einsum('ijk,ijk->ij', diff, diff) + self.softening**2
+            r2[np.arange(len(rows)), rows] = 1 # no force on a body from itself
+            inv = self.masses/np.sqrt(r2)
+            inv[np.arange(len(rows)), rows] = 0
+            if potential:
+                phi[rows] = -self.G*inv.sum(axis=1)
+            acc[rows] = self.G*np.einsum('ij,ijk->ik', inv/r2, diff)
+        return acc, phi
+
+    def _tree(self, q): # levels of cells from sorting the bodies along a Morton (Z-order) curve
+        # each cell is a run of the sorted bodies sharing the leading bits of their keys, so is described by its start and count
+        # returns the order of the bodies and for each level (starts, counts, masses, centres of mass, cell width)
+        n, d = q.shape
+        depth = 62//d # bits per axis which fit in an int64 key
+        low = q.min(axis=0)
+        width = np.max(q.max(axis=0) - low)
+        width = width*(1+1e-12) if width > 0 else 1.0
+        cells = np.minimum(((q - low)/width*2.0**depth).astype(np.int64), 2**depth-1)
+        keys = np.zeros(n, dtype=np.int64)
+        for bit in range(depth): # interleave the bits of the cell on each axis
+            for axis in range(d):
+                keys |= ((cells[:, axis] >> bit) & 1) << (bit*d + axis)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        masses = self.masses[order]
+        positions = q[order]
+        weighted = masses[:, None]*positions
+        levels = []
+        for level in range(depth+1):
+            prefix = keys >> (d*(depth-level))
+            starts = np.flatnonzero(np.concatenate(([True], prefix[1:] != prefix[:-1])))
+            counts = np.diff(np.append(starts, n))
+            if counts.max() == 1: # every body has a cell of its own
+                break
+            mass = np.add.reduceat(masses, starts)
+            com = np.add.reduceat(weighted, starts)
+            com = np.divide(com, mass[:, None], out=positions[starts].copy(), where=mass[:, None] > 0) # massless cells at their first body
+            if len(levels) > 0 and len(starts) == len(levels[-1][0]): # same cells as the level above, only smaller
+                levels.pop()
+            levels.append((starts, counts, mass, com, width/2**level))
+        levels.append((np.arange(n), np.ones(n, dtype=int), masses, positions, 0.0)) # the bodies themselves
+        return order, levels
+
+    def _barnesHut(self, q, potential=False): # O(N log N), distant cells act as a single mass at their centre of mass
+        n = len(q)
+        order, levels = self._tree(q)
+        rank = np.empty(n, dtype=int) # position of each body in the sorted order
+        rank[order] = np.arange(n)
+        acc = np.zeros_like(q)
+        phi = np.zeros(n) if potential else None
+        eps2 = self.softening**2
+        bodies = np.arange(n) # (body, cell) pairs still to be considered, starting from the root
+        cells = np.zeros(n, dtype=int)
+        for level in range(len(levels)):
+            starts, counts, mass, com, size = levels[level]
+            inside = (starts[cells] <= rank[bodies]) & (rank[bodies] < starts[cells] + counts[cells]) # cell contains the body
+            diff = com[cells] - q[bodies]
+            r2 = np.einsum('ij,ij->i', diff, diff)
+            accept = ~inside & ((counts[cells] == 1) | (size*size < self.theta**2*r2))
+            if accept.any():
+                r2a = r2[accept] + eps2
+                inv = mass[cells[accept]]/np.sqrt(r2a)
+                for axis in range(q.shape[1]):
+                    acc[:, axis] += np.bincount(bodies[accept], weights=inv/r2a*diff[accept, axis], minlength=n)
+                if potential:
+                    phi -= np.bincount(bodies[accept], weights=inv, minlength=n)
+            split = ~accept & (counts[cells] > 1) # cells too close, replaced by their cells on the next level
+            if level == len(levels)-1 or not split.any():
+                break
+            following = levels[level+1][0]
+            first = np.searchsorted(following, starts[cells[split]])
+            number = np.searchsorted(following, starts[cells[split]] + counts[cells[split]]) - first
+            bodies = np.repeat(bodies[split], number)
+            cells = np.repeat(first - np.cumsum(number) + number, number) + np.arange(number.sum())
+        acc *= self.G
+        if potential:
+            phi *= self.G
+        return acc, phi
+
+    def ODESolve(self, initial, times, method="leapfrog", substeps=1, rtol=1e-6, atol=1e-9, diagnostic=False): # initial = positions of every body then velocities
+        self.start = perf_counter() # times total time
+        initial = np.asarray(initial, dtype=float)
+        n = len(self)*self.d
+        if initial.shape != (2*n,):
+            raise Exception("initial should have " + str(2*n) + " values, the " + str(self.d) + " coordinates of each body then their velocities")
+        calls = [0]
+        def accel(q):
+            calls[0] += 1
+            return self._forces(q.reshape(len(self), self.d))[0].reshape(n)
+        if method in ["verlet", "leapfrog", "yoshida4", "yoshida6"]: # symplectic, energy error stays bounded
+            self.data = getattr(integrators, method)(accel, initial, times, substeps)
+        elif method == "rk4":
+            self.data = integrators.rk4(lambda y: np.concatenate((y[n:], accel(y[:n]))), initial, times, substeps)
+        elif method == "rk45":
+            self.data = integrators.rk45(lambda y: np.concatenate((y[n:], accel(y[:n]))), initial, times, rtol, atol)
+        else:
+            raise Exception("unknown method " + str(method) + ", should be 'verlet', 'leapfrog', 'yoshida4', 'yoshida6', 'rk4' or 'rk45'")
+        self.times = times # store times that corresponds with data
+        self.stats = {"method": method, "force": "tree" if self._useTree() else "direct", "nfev": calls[0], "nsteps": (len(times)-1)*substeps if method != "rk45" else None, "wall_time": perf_counter()-self.start}
+        if diagnostic:
+            energy = self.energy()
+            print("data created: " + str(self.stats["wall_time"]))
+            print("relative energy error: " + str(np.max(np.abs(energy - energy[0]))/abs(energy[0])))
+            print("momentum change: " + str(np.max(np.linalg.norm(self.momentum() - self.momentum()[0], axis=-1))))
+        return self.data
+
+    def _split(self, data): # positions and velocities with shape (time, body, d)
+        data = np.atleast_2d(self.data if data is None else data)
+        n = len(self)*self.d
+        return data[:, :n].reshape(-1, len(self), self.d), data[:, n:2*n].reshape(-1, len(self), self.d)
+
+    def energy(self, data=None): # total kinetic and potential energy at each state of data
+        positions, velocities = self._split(data)
+        kinetic = 0.5*np.einsum('j,ijk,ijk->i', self.masses, velocities, velocities)
+        potential = np.array([0.5*np.dot(self.masses, self._forces(j, potential=True)[1]) for j in positions]) # each pair counted twice
+        return kinetic + potential
+
+    def momentum(self, data=None): # total momentum vector at each state of data
+        return np.einsum('j,ijk->ik', self.masses, self._split(data)[1])
+
+    def angularMomentum(self, data=None): # total angular momentum about the origin at each state of data, a scalar in 2d
+        positions, velocities = self._split(data)
+        return np.einsum('j,ij...->i...', self.masses, np.cross(positions, velocities))
+
+    def centreOfMass(self, data=None): # position of the centre of mass at each state of data
+        return np.einsum('j,ijk->ik', self.masses, self._split(data)[0])/self.masses.sum()
+
+    @staticmethod
+    def saveSystem(sys, filename, datas=True): # saved as a .lag file like SystemL, which SystemL.loadSystem also reads
+        from symphysics.symsystem import SystemL
+        SystemL.saveSystem(sys, filename, datas=datas)
+
+    @staticmethod
+    def loadSystem(filename):
+        from symphysics.symsystem import SystemL
+        sys = SystemL.loadSystem(filename)
+        if not isinstance(sys, SystemN):
+            raise Exception(filename + ".lag is not an N-body system")
+        return sys
@@ -4,22 +4,55 @@ import matplotlib as mpl
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
 from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
+import functools, multiprocessing, subprocess, warnings
 from pathlib import Path
 
+_exporting = [] # Animate being exported, inherited by forked workers rather than pickled
+
+def _renderFrames(frames, dpi): # in a worker, rgba bytes of each frame in the range drawn off screen with Agg
+    animate = _exporting[0]
+    animate.fig.set_dpi(dpi)
+    canvas = FigureCanvasAgg(animate.fig) # headless, whatever the backend of the parent
+    animate.seek(frames.start-1) # state before the first frame, including traces and fades
+    canvas.draw() # the first draw settles the layout, as the initial draw of a serial export does
+    result = []
+    for j in frames:
+        animate.update(j)
+        canvas.draw()
+        result.append(bytes(canvas.buffer_rgba()))
+    return canvas.get_width_height(), result
+
 class Particle():
-    def __init__ (self, a, conv, color, s, ax, d):
+    def __init__ (self, a, conv, color, s, ax, d, vectorized=False):
         self.d = d
         self.color = color # color
         self.conversion = conv # conversion function from general coords to x,y(,z)
-        self.position = np.array([[j] for j in self.conversion(a)]) # get position into a numpy array - each coordinate as a list - required in 3d
+        self.vectorized = vectorized # conversion takes an array of states, one per row, and returns one row of x,y(,z) per state
+        self.positions = None # positions at every time if vectorized, calculated once by precompute
+        self.position = self._convert(a) # get position into a numpy array - each coordinate as a list - required in 3d
         if d == 2: # if 2d arrange particles at front: plot initial position
             self.pt, = ax.plot(*self.position,mfc=self.color, mec=self.color, marker='o', markersize=s , zorder=3)
         else:
             self.pt, = ax.plot(*self.position,mfc=self.color, mec=self.color, marker='o', markersize=s)
+
+    def _convert(self, a): # position as a column, one row per coordinate
+        if self.vectorized:
+            return np.asarray(self.conversion(np.asarray(a)[None]), dtype=float)[0, :, None]
+        return np.array([[j] for j in self.conversion(a)])
+
+    def precompute(self, data): # positions for every state in data at once, (T, state) to (T, d)
+        if self.vectorized:
+            self.positions = np.asarray(self.conversion(data), dtype=float)
+            if self.positions.shape != (len(data), self.d):
+                raise Exception("vectorized conversion should return positions of shape " + str((len(data), self.d)) + ", got " + str(self.positions.shape))
     
-    def update(self,a): # update particle with general coordinates/velocities in 'a'
-        self.position = np.array([[j] for j in self.conversion(a)]) # update position
+    def update(self, a, j=None): # update particle with general coordinates/velocities in 'a', which is row j of the precomputed data
+        if self.positions is not None and j is not None:
+            self.position = self.positions[j, :, None] # view, no python conversion
+        else:
+            self.position = self._convert(a) # update position
         self.pt.set_data(*self.position[0:2])
         if self.d == 3: # if 3d also update z position
             self.pt.set_3d_properties(self.position[2])
@@ -32,13 +65,21 @@ class Rod():
         self.start = p1 # particles at either end of rod
         self.end = p2
         self.data = np.concatenate((self.start.position, self.end.position), axis=1) #sotre end points of rod as coords in a line
+        self.segments = None # end points at every time, if both particles are precomputed
         if self.d == 2: # if 2d set position behind particles: set initial positions
             self.ln, = ax.plot(*np.concatenate((self.start.position, self.end.position), axis=1),color=self.color, zorder=2) 
         else:
             self.ln, = ax.plot(*np.concatenate((self.start.position, self.end.position), axis=1),color=self.color)
 
-    def update(self): # update 
-        self.data = np.concatenate((self.start.position, self.end.position), axis=1) # update position
+    def precompute(self):
+        if self.start.positions is not None and self.end.positions is not None:
+            self.segments = np.stack((self.start.positions, self.end.positions), axis=2) # (T, d, 2)
+
+    def update(self, j=None): # update, to time j of the precomputed positions if given
+        if self.segments is not None and j is not None:
+            self.data = self.segments[j]
+        else:
+            self.data = np.concatenate((self.start.position, self.end.position), axis=1) # update position
         self.ln.set_data(*self.data[0:2])
         if self.d == 3: # if 3d also update z positions
             self.ln.set_3d_properties(self.data[2])
@@ -50,35 +91,68 @@ class Spring(Rod): # spring inherits rod
         self.nat_l = nat_l
         super().__init__(p1, p2, color, ax, d)
     
-    def update(self):
-        super().update(self.d)
+    def update(self, j=None):
+        super().update(j)
         length = float(np.linalg.norm(self.start.position-self.end.position)) # get length of spring
         coloring = (length-self.nat_l)/self.nat_l # ratio of extension to length
         self.new_color = mpl.colors.hsv_to_rgb((0,1,1-min(1,abs(coloring)))) # get color based on coloring
         self.ln.set_color(self.new_color) # set color
 
 
+class _RingBuffer(): # the most recent rows, each stored twice so that the rows in order are always a contiguous view
+    def __init__(self, capacity, shape):
+        self.capacity = capacity
+        self.buffer = np.empty((2*capacity,) + tuple(shape))
+        self.clear()
+
+    def append(self, row): # replaces the oldest row once full, no copying of the other rows
+        self.buffer[self.end] = row
+        self.buffer[self.end + self.capacity] = row
+        self.end = (self.end + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def view(self): # rows from oldest to newest, without copying
+        return self.buffer[self.end + self.capacity - self.count:self.end + self.capacity]
+
+    def clear(self):
+        self.end = 0 # index after the newest row
+        self.count = 0
+
+
 class Trace():
     def __init__(self,p,length,color,ax, d):
         self.d = d
         self.color = color # set colour of trace, defaults to colour of the particle
         self.length = length # how many frames you want the trace to last
         self.particle = p # particle you are tracing
-        self.traceCoords = self.particle.position # coordinates of the particle
+        self.trail = _RingBuffer(length+1, (d,)) # last length+1 positions
+        self.reset()
+        self.positions = None # positions at every time, if the particle is precomputed
         if d == 2:
             self.ln, = ax.plot(*self.traceCoords, color = color, zorder=1)
         else:
             self.ln, = ax.plot(*self.traceCoords, color = color)
 
-    
-    def update(self):
-        if np.size(self.traceCoords, 1) > self.length:
-            self.traceCoords = np.delete(self.traceCoords, [0], 1) # delete the oldest part of the trace once its too old
-        self.traceCoords = np.concatenate((self.traceCoords, self.particle.position), axis=1)
+    def precompute(self):
+        self.positions = self.particle.positions
+
+    def update(self, j=None):
+        if self.positions is not None and j is not None: # the trace is the last length+1 positions
+            self.traceCoords = self.positions[max(0, j-self.length):j+1].T
+        else:
+            self._append()
         self.ln.set_data(*self.traceCoords[0:2])
         if self.d == 3:
             self.ln.set_3d_properties(self.traceCoords[2])
 
+    def _append(self): # add the particle's current position, the oldest is forgotten once the trace is full
+        self.trail.append(self.particle.position[:, 0])
+        self.traceCoords = self.trail.view().T
+
+    def reset(self): # start the trace again from the particle's current position
+        self.trail.clear()
+        self._append()
+
 
 class Fade(Trace): 
     def __init__(self,p,length,color,ax, d):
@@ -93,26 +167,33 @@ class Fade(Trace):
             self.rgba = np.concatenate((self.rgba,np.array([self.rgb[0],self.rgb[1],self.rgb[2],i/self.length])))
         self.rgba = np.reshape(self.rgba,(-1,4))
         self.cmp = mpl.colors.ListedColormap(self.rgba)
-        self.traceCoords = np.swapaxes([self.particle.position],1,2) # coordinates of the particle
-        self.traceCoords = np.concatenate((self.traceCoords, self.traceCoords),axis= 1)
+        self.trail = _RingBuffer(length+1, (2, d)) # last length+1 segments
+        self.reset()
+        self.segments = None # segment ending at every time, if the particle is precomputed
         if d == 2:
             lnColl = LineCollection(self.traceCoords, color=self.rgba)
         else:
             lnColl = Line3DCollection(self.traceCoords, color=self.rgba)
         self.ln = ax.add_collection(lnColl)
 
-    
-    def update(self):
-        if np.size(self.traceCoords, 0) > self.length:
-            self.traceCoords = np.delete(self.traceCoords, [0], 0) # delete the oldest part of the trace once its too old
-        new_segment = np.concatenate(([[self.traceCoords[-1, 1, :]]], np.swapaxes([self.particle.position], 1, 2)), axis=1)
-        self.traceCoords = np.concatenate((self.traceCoords, new_segment), axis=0)
-        self.ln.remove()
-        if self.d == 2:
-            lnColl = LineCollection(self.traceCoords, color=self.rgba)
-        else:
-            lnColl = Line3DCollection(self.traceCoords, color=self.rgba)
-        self.ln = self.ax.add_collection(lnColl)
+    def precompute(self):
+        positions = self.particle.positions
+        if positions is not None: # segment j joins positions j-1 and j, the first has zero length
+            self.segments = np.stack((np.concatenate((positions[:1], positions[:-1])), positions), axis=1) # (T, 2, d)
+
+    def update(self, j=None):
+        if self.segments is not None and j is not None: # the last length+1 segments
+            self.traceCoords = self.segments[max(0, j-self.length):j+1]
+            self.ln.set_segments(self.traceCoords)
+            return
+        self.trail.append((self.traceCoords[-1, 1], self.particle.position[:, 0])) # from the end of the last segment, the oldest is forgotten once full
+        self.traceCoords = self.trail.view()
+        self.ln.set_segments(self.traceCoords) # same collection reused, colours are given to the segments in order
+
+    def reset(self): # start the fade again from the particle's current position, with a zero length segment
+        self.trail.clear()
+        self.trail.append((self.particle.position[:, 0], self.particle.position[:, 0]))
+        self.traceCoords = self.trail.view()
 
 
 class Polygon():
@@ -126,31 +207,34 @@ class Polygon():
         for i in self.ps[1:]:
             self.data = np.concatenate((self.data, i.position),axis=1)
         self.data = self.data.T
+        self.vertices = None # vertices at every time, if every particle is precomputed
         if d == 2:
             self.patch = mpl.patches.Polygon(self.data,closed=True, fc=self.color, ec=self.color,alpha=self.alpha)
             ax.add_patch(self.patch)
         else:
-            poly = Poly3DCollection(self.data)
+            poly = Poly3DCollection([self.data])
             poly.set_alpha(self.alpha)
             poly.set_facecolor(self.color)
             poly.set_edgecolor(self.color)
             self.patch = self.ax.add_collection(poly)
 
 
-    def update(self):
-        self.data = self.ps[0].position
-        for i in self.ps[1:]:
-            self.data = np.concatenate((self.data, i.position),axis=1)
-        self.data = self.data.T
+    def precompute(self):
+        if all(j.positions is not None for j in self.ps):
+            self.vertices = np.stack([j.positions for j in self.ps], axis=1) # (T, vertices, d)
+
+    def update(self, j=None):
+        if self.vertices is not None and j is not None:
+            self.data = self.vertices[j]
+        else:
+            self.data = self.ps[0].position
+            for i in self.ps[1:]:
+                self.data = np.concatenate((self.data, i.position),axis=1)
+            self.data = self.data.T
         if self.d == 2:
             self.patch.set_xy(self.data)
         else:
-            self.patch.remove()
-            poly = Poly3DCollection(self.data)
-            poly.set_alpha(self.alpha)
-            poly.set_facecolor(self.color)
-            poly.set_edgecolor(self.color)
-            self.patch = self.ax.add_collection(poly)
+            self.patch.set_verts([self.data]) # same collection reused
 
             
 class Polyhedra(): # TODO
@@ -194,6 +278,10 @@ class Animate():
         self.polygons = []
         self.data = data # data of general coordinate values at times t
         self.time = t # np.array of times
+        self.stream = None
+        if hasattr(data, "__next__"): # blocks of (times, data) from SystemL.ODESolveStream, rendered as they are calculated
+            self.stream = data
+            self.data = None
     
     def limits(self,x,y,z=False, row=1, column=1): # set axes limits
         row, column = self._check_ax(row, column)
@@ -203,57 +291,78 @@ class Animate():
             self.ax[row][column].set_zlim(z[0], z[1])
             self.ax[row][column].autoscale_view()
     
-    def create_particle(self,a,conv, color = 'red', s=10, row=1, column=1): # create a particle and store
+    def create_particle(self,a,conv, color = 'red', s=10, row=1, column=1, vectorized=False): # create a particle and store
         row, column = self._check_ax(row, column)
-        temp = Particle(a,conv, color, s, self.ax[row][column], self.dimension[row][column])
+        temp = Particle(a,conv, color, s, self.ax[row][column], self.dimension[row][column], vectorized)
+        if self.data is not None: # positions for the whole animation calculated now, rather than every frame
+            temp.precompute(self.data)
         self.particles.append(temp)
         return temp # return particle reference
     
     def create_rod(self,p1,p2, color='k', row=1, column=1): # create a rod and store
         row, column = self._check_ax(row, column)
         self.rods.append(Rod(p1,p2,color,self.ax[row][column], self.dimension[row][column]))
+        self.rods[-1].precompute()
     
     def create_trace(self,p,length,color = None, row=1, column=1): # create a trace and store
         row, column = self._check_ax(row, column)
         if color == None: # if no color given set to particle color
             color = p.color
         self.traces.append(Trace(p,length,color,self.ax[row][column], self.dimension[row][column]))
+        self.traces[-1].precompute()
     
     def create_spring(self,p1,p2,lamb,nat_l,color='red', row=1, column=1): # create a spring and store
         row, column = self._check_ax(row, column)
         self.springs.append(Spring(p1,p2,lamb,nat_l,color,self.ax[row][column],self.dimension[row][column]))
+        self.springs[-1].precompute()
 
     def create_fade(self,p,length,color = None, row=1, column=1):
         row, column = self._check_ax(row, column)
         if color == None: # if no color given set to particle color
             color = p.color
         self.fades.append(Fade(p,length,color,self.ax[row][column], self.dimension[row][column]))
+        self.fades[-1].precompute()
     
     def create_polygon(self,ps,color='red',alpha=0.5, row=1, column=1):
         row, column = self._check_ax(row, column)
         self.polygons.append(Polygon(ps,color,alpha,self.ax[row][column],self.dimension[row][column]))
+        self.polygons[-1].precompute()
     
-    def update(self,j): # update at time j
+    def update(self,j): # update at time j, returns the artists drawn
+        return self.update_state(self.data[j], j) # pass in slice of data at time j
+
+    def update_state(self, a, j=None): # update objects with general coordinates/velocities in 'a', row j of the precomputed positions, returns the artists drawn
         for i in range(len(self.particles)): # update objects by calling function
-            self.particles[i].update(self.data[j]) # pass in slice of data at time j
+            self.particles[i].update(a, j)
         for i in self.rods:
-            i.update()
+            i.update(j)
         for i in self.traces:
-            i.update()
+            i.update(j)
         for i in self.springs:
-            i.update()
+            i.update(j)
         for i in self.fades:
-            i.update()
+            i.update(j)
         for i in self.polygons:
-            i.update()
+            i.update(j)
+        return self._artists()
 
+    def _artists(self): # every matplotlib artist of the objects, updated in place each frame
+        return [j.pt for j in self.particles] + [j.patch for j in self.polygons] + [j.ln for j in self.fades + self.traces + self.rods + self.springs]
 
-    def run(self, fps): # run the animation as a window to be seen
-        self.ani = FuncAnimation(self.fig,self.update,range(1,len(self.time)), interval=1000/fps, blit=False)
+    def run(self, fps, blit=False): # run the animation as a window to be seen
+        self.ani = self._animation(fps, blit)
         plt.show()
 
-    def savegif(self, filename, fps): # save animation as a gif: requires pillow
-        self.ani = FuncAnimation(self.fig,self.update,range(1,len(self.time)), interval=1000/fps, blit=False) # create animation
+    def savegif(self, filename, fps, workers=None): # save animation as a gif: requires pillow
+        if workers != None and workers > 1 and self._canExport():
+            from PIL import Image
+            images = []
+            for size, frame in self._renderParallel(self.fig.dpi, workers): # converted as PillowWriter does
+                image = Image.frombuffer("RGBA", size, frame, "raw", "RGBA", 0, 1)
+                images.append(image if image.getextrema()[3][0] < 255 else image.convert("RGB"))
+            images[0].save(filename + '.gif', save_all=True, append_images=images[1:], duration=int(1000/fps), loop=0)
+            return
+        self.ani = self._animation(fps) # create animation
         #base_path = Path(__file__).parent # get main path of workspace
         filename += '.gif'
         #file_path = (base_path / "../gifs/"/filename).resolve() # put filename in correct subdirectory
@@ -261,9 +370,21 @@ class Animate():
         #self.ani.save(file_path, writer = writer) # save gif with pillow
         self.ani.save(filename, writer = writer)
     
-    def savemp4(self, filename, fps, ffmpeg_loc='C:/FFmpeg/bin/ffmpeg', dpi=500): # save animation as mp4: requires ffmpeg
+    def savemp4(self, filename, fps, ffmpeg_loc='C:/FFmpeg/bin/ffmpeg', dpi=500, workers=None): # save animation as mp4: requires ffmpeg
         plt.rcParams['animation.ffmpeg_path'] = ffmpeg_loc # locate ffmpeg on computer
-        self.ani = FuncAnimation(self.fig,self.update,range(1,len(self.time)), interval=1000/fps, blit=False) # create animation
+        if workers != None and workers > 1 and self._canExport():
+            process = None
+            for size, frame in self._renderParallel(dpi, workers): # raw frames piped to ffmpeg in order
+                if process == None:
+                    command = [ffmpeg_loc, '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', '%dx%d' % size, '-pix_fmt', 'rgba', '-r', str(fps), '-i', 'pipe:',
+                               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'h264', '-pix_fmt', 'yuv420p', '-b:v', '5000k', filename + '.mp4'] # h264 needs even dimensions
+                    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                process.stdin.write(frame)
+            error = process.communicate()[1]
+            if process.returncode != 0:
+                raise Exception("ffmpeg failed: " + error.decode(errors="replace")[-1000:])
+            return
+        self.ani = self._animation(fps) # create animation
         #base_path = Path(__file__).parent # get main path of workspace
         filename += '.mp4'
         #file_path = str((base_path / "../mp4s/"/filename).resolve()) # put filename in correct subdirectory
@@ -271,6 +392,55 @@ class Animate():
         #self.ani.save(file_path, writer = writer, dpi=dpi) # write mp4 to file - high default dpi to get quality
         self.ani.save(filename, writer = writer, dpi=dpi)
 
+    def seek(self, j): # set every object to time j, replaying the frames needed to rebuild traces and fades
+        trails = self.traces + self.fades
+        start = max(0, j - max([i.length for i in trails] + [0]) - 2) if len(trails) > 0 else j # earlier frames drop out of the trails
+        self.update_state(self.data[start], start)
+        for i in trails:
+            i.reset()
+        for k in range(start+1, j+1):
+            self.update(k)
+        return self._artists()
+
+    def _canExport(self): # parallel export needs the whole data and forked workers which share the objects
+        if self.stream != None:
+            raise Exception("parallel export requires the whole data, not a stream")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            warnings.warn("parallel export requires the fork start method, frames will be rendered serially")
+            return False
+        return True
+
+    def _renderParallel(self, dpi, workers): # generator of (size, rgba bytes) of every frame after the first in order, rendered by a pool of processes
+        frames = range(1, len(self.time))
+        chunk = max(1, min(25, len(frames)//(4*workers))) # small chunks to limit memory and keep the pool busy
+        _exporting[:] = [self]
+        try:
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                for size, block in pool.imap(functools.partial(_renderFrames, dpi=dpi), [frames[j:j+chunk] for j in range(0, len(frames), chunk)]):
+                    for frame in block:
+                        yield size, frame
+        finally:
+            _exporting.clear()
+
+    def _animation(self, fps, blit=False): # animation of all frames after the first
+        # with blit only the artists are redrawn over a saved background, if the backend supports it
+        # init_func draws the initial state, otherwise matplotlib draws the first frame twice which would duplicate it in traces
+        if self.stream == None:
+            return FuncAnimation(self.fig,self.update,range(1,len(self.time)), init_func=self._artists, interval=1000/fps, blit=blit)
+        return FuncAnimation(self.fig, self._update_stream, self._stream_states(), init_func=self._artists, interval=1000/fps, blit=blit, save_count=None, cache_frame_data=False)
+
+    def _update_stream(self, frame):
+        return self.update_state(*frame)
+
+    def _stream_states(self): # (state, row) from the stream, each block calculated as it is needed
+        first = True
+        for times, block in self.stream:
+            for i in self.particles: # only particle positions are precomputed per block, other objects need the whole data
+                i.precompute(block)
+            for j in range(1 if first else 0, len(block)): # skip the initial state as for data
+                yield block[j], j
+            first = False
+
     def _check_ax(self, row, column):
         if row < 1 or row > self.rows: # check if row/column allowed
             raise Exception("Row index out of range, should be 1 <= row <= " + str(self.rows) +", you gave row=" + str(row))
@@ -0,0 +1,74 @@
+#IMPORTS
+import numpy as np
+import json, os, pathlib
+
+class Trajectory():
+    # trajectory stored on disk as raw arrays with a small json header, read lazily with np.memmap
+    # the directory holds header.json, times.bin with one float64 per time and data.bin with one row per time
+    # new rows can be appended, e.g. blocks from SystemL.ODESolveStream
+    FORMAT = "symphysics-trajectory"
+    VERSION = 1
+
+    def __init__(self, path, shape=None): # opens an existing trajectory, or creates one with rows of the given shape
+        self.path = pathlib.Path(path)
+        if shape != None: # create a new empty trajectory
+            self.path.mkdir(parents=True, exist_ok=True)
+            for j in ["times.bin", "data.bin"]:
+                open(self.path / j, 'wb').close()
+            self.header = {"format": self.FORMAT, "version": self.VERSION, "dtype": "<f8", "shape": [int(j) for j in np.atleast_1d(shape)], "length": 0, "chunks": 0}
+            self._writeHeader()
+        else:
+            with open(self.path / "header.json") as infile:
+                self.header = json.load(infile)
+            if self.header.get("format") != self.FORMAT:
+                raise Exception(str(self.path) + " is not a symphysics trajectory")
+            if self.header["version"] > self.VERSION:
+                raise Exception("trajectory version number exceeds maximum - please update your symphysics")
+
+    def __len__(self):
+        return self.header["length"]
+
+    @property
+    def shape(self): # shape of the whole data array
+        return (len(self),) + tuple(self.header["shape"])
+
+    @property
+    def times(self): # times of each row, read lazily from disk
+        if len(self) == 0: # np.memmap can't map an empty file
+            return np.empty(0)
+        return np.memmap(self.path / "times.bin", dtype=self.header["dtype"], mode='r', shape=(len(self),))
+
+    @property
+    def data(self): # all rows, read lazily from disk
+        if len(self) == 0:
+            return np.empty(self.shape)
+        return np.memmap(self.path / "data.bin", dtype=self.header["dtype"], mode='r', shape=self.shape)
+
+    def window(self, t_start, t_end): # times and rows with t_start <= time <= t_end, only these are read from disk
+        times = self.times
+        start, end = np.searchsorted(times, t_start, side="left"), np.searchsorted(times, t_end, side="right")
+        return times[start:end], self.data[start:end]
+
+    def append(self, times, data): # add rows to the end of the trajectory
+        times = np.ascontiguousarray(times, dtype=self.header["dtype"])
+        data = np.ascontiguousarray(data, dtype=self.header["dtype"])
+        if data.shape != times.shape + tuple(self.header["shape"]):
+            raise Exception("data of shape " + str(data.shape) + " does not match " + str(len(times)) + " rows of shape " + str(tuple(self.header["shape"])))
+        with open(self.path / "times.bin", 'ab') as outfile:
+            outfile.write(times.tobytes())
+        with open(self.path / "data.bin", 'ab') as outfile:
+            outfile.write(data.tobytes())
+        self.header["length"] += int(len(times))
+        self.header["chunks"] += 1
+        self._writeHeader()
+
+    def write(self, stream): # append every block of a stream of (times, data), returns the trajectory
+        for times, data in stream:
+            self.append(times, data)
+        return self
+
+    def _writeHeader(self): # atomic so readers never see a partial header
+        temp = self.path / "header.json.tmp"
+        with open(temp, 'w') as outfile:
+            json.dump(self.header, outfile)
+        os.replace(temp, self.path / "header.json")
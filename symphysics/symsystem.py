@@ -1,48 +1,251 @@
 #IMPORTS
-from sympy.physics.mechanics import dynamicsymbols, mlatex
 import sympy as sp
 import numpy as np
 from sympy.calculus.euler import euler_equations
-from scipy.integrate import odeint
-import copy, pickle, pathlib, dill, functools
+from sympy.printing.numpy import NumPyPrinter
+from sympy.core.function import AppliedUndef
+import copy, pickle, pathlib, json, functools, collections, multiprocessing, os, shutil, signal, tempfile, threading, warnings
+from symphysics import integrators
+from symphysics.cache import EquationCache
+from symphysics.storage import Trajectory
 from time import perf_counter
 
 t = sp.symbols("t") # time symbol
 
-def _get_functions(function, current = [] ,top_level = False): # recursive
-    returns = [] # funtions to return, current is those already found
-    sub_functions = list(function.atoms(sp.Function)) # get all functions whch are arguments
-    if function.is_Function: # if this is a function not an expression
-        sub_functions.remove(function) # remove itself from the list
-        if function not in [j[0] for j in current] and not top_level: # if not already recorded and we want to record it (not first argument passed in)
-            sub_args = list(function.args) # split it's arguments into symbols and functions
-            sub_symbols = []
-            sub_funcs = []
-            for j in sub_args:
-                if j.is_Symbol:
-                    sub_symbols.append(j)
-                elif j.is_Function:
-                    sub_funcs.append(j)
-            try: # return the tuple respresenting the conversin of this function into a symbol
-                returns.append((function, sp.Symbol(function.name + "_temp"), sub_funcs, sub_symbols))
-            except: # if fails as function has no name then function is in built - allowed
-                pass
-    for i in sub_functions: # combine tuples from all sub_functions
-        returns += _get_functions(i, current = returns + current, top_level = False)
-    return returns
-
-def _get_func_from_iter(iterable):
-    returns = []
-    for expr in iterable: # combine functions in all expressions in iterable e.g. list
-        returns += _get_functions(expr)
-    final = []
-    for j in returns: # remove any duplicates
-        if j not in final:
-            final.append(j)
-    return final # return iterable of all functions
+def _get_func_from_iter(iterable): # (function, symbol, function arguments, symbol arguments) for every undefined function in iterable, each once
+    found = {}
+    for expr in iterable:
+        for function in sp.sympify(expr).atoms(AppliedUndef): # includes functions nested in the arguments of others
+            if function not in found:
+                found[function] = (function, sp.Symbol(function.name + "_temp"), [j for j in function.args if j.is_Function], [j for j in function.args if j.is_Symbol])
+    return [found[j] for j in sorted(found, key=sp.default_sort_key)]
+
+class _SimplifyTimeout(Exception):
+    pass
+
+def _raiseTimeout(signum, frame):
+    raise _SimplifyTimeout()
+
+def _simplifyEquation(eq, strategy="full", timeout=None, variables=[]): # simplify one equation, within timeout seconds if given
+    stages = {"none": [], # each stage applied in turn
+              "cheap": [lambda j: sp.Eq(sp.collect(sp.expand(j.lhs - j.rhs), variables), 0)],
+              "trig": [sp.trigsimp],
+              "full": [sp.simplify, sp.trigsimp, sp.factor]}
+    if strategy not in stages:
+        raise Exception("unknown simplification strategy " + str(strategy) + ", should be one of " + ", ".join(stages))
+    timed = timeout != None and hasattr(signal, "setitimer")
+    if timed and threading.current_thread() is not threading.main_thread(): # signals are only delivered to the main thread
+        warnings.warn("simplification timeout only supported on the main thread, equations will be fully simplified")
+        timed = False
+    if timed: # interrupt simplification once out of time
+        earlier = signal.getitimer(signal.ITIMER_REAL) # any timer of the caller, re-armed afterwards
+        started = perf_counter()
+        previous = signal.signal(signal.SIGALRM, _raiseTimeout)
+    try:
+        try:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            for stage in stages[strategy]:
+                if isinstance(eq, sp.Eq): # may have simplified to True or False
+                    eq = stage(eq) # only replaced once a stage completes
+        finally:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except _SimplifyTimeout: # keep result of the last completed stage, also if the alarm comes after it
+        pass
+    finally:
+        if timed:
+            signal.signal(signal.SIGALRM, previous)
+            if earlier[0] > 0: # with the time it had left, firing straight away if that has passed
+                signal.setitimer(signal.ITIMER_REAL, max(earlier[0] - (perf_counter()-started), 1e-6), earlier[1])
+    return eq
+
+def _simplifyEquations(eqs, strategy="full", timeout=None, processes=None, variables=[]): # simplify a list of equations, in parallel if processes given
+    if timeout != None and not hasattr(signal, "setitimer"):
+        warnings.warn("simplification timeout not supported on this platform, equations will be fully simplified")
+    args = [(j, strategy, timeout, variables) for j in eqs]
+    if processes != None and processes > 1 and strategy != "none":
+        with multiprocessing.Pool(processes) as pool:
+            return pool.starmap(_simplifyEquation, args)
+    return [_simplifyEquation(*j) for j in args]
+
+def _matrixBlocks(matrix): # (rows, columns) of each block of a square matrix which doesn't share a row with any other, in order of first column
+    parent = list(range(matrix.cols)) # union find of columns joined by a non zero entry in the same row
+    def find(j):
+        while parent[j] != j:
+            parent[j] = parent[parent[j]]
+            j = parent[j]
+        return j
+    rowColumns = [[k for k in range(matrix.cols) if matrix[j, k] != 0] for j in range(matrix.rows)]
+    for columns in rowColumns:
+        for k in columns[1:]:
+            parent[find(k)] = find(columns[0])
+    blocks = {}
+    for k in range(matrix.cols):
+        blocks.setdefault(find(k), ([], []))[1].append(k)
+    whole = [(list(range(matrix.rows)), list(range(matrix.cols)))]
+    for j in range(matrix.rows):
+        if len(rowColumns[j]) == 0: # singular, solved whole so LUsolve raises as before
+            return whole
+        blocks[find(rowColumns[j][0])][0].append(j)
+    if any(len(rows) != len(columns) for rows, columns in blocks.values()):
+        return whole
+    return list(blocks.values())
+
+def _luSolve(matrixA, matrixB):
+    return matrixA.LUsolve(matrixB)
+
+
+_worker = {} # state of a runMany worker process, set once when the worker starts
+
+def _initRunMany(system, path, shape, options): # pool initializer, the system's compiled functions are unpickled once per worker
+    _worker["system"] = system
+    _worker["out"] = np.memmap(path, dtype=float, mode='r+', shape=shape) # shared result array, written in place
+    _worker["options"] = options
+
+def _runManyTask(task): # solve one task of runMany into its rows of the shared result array
+    index, initial, constants, times, offset = task
+    system = _worker["system"]
+    data = system.ODESolve(initial, times, constants, **_worker["options"])
+    _worker["out"][offset:offset+len(data)] = data
+    return index, len(data), system.stats
+
+
+def _countingSolver(method): # solve_ivp solver class which also counts the rejected steps of explicit runge-kutta methods
+    import scipy.integrate
+    solvers = [] # instances created, so the counts can be read after solve_ivp returns
+    class CountingSolver(getattr(scipy.integrate, method)):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.nrejected = 0 if hasattr(self, "n_stages") else None # unknown for implicit methods
+            solvers.append(self)
+
+        def _step_impl(self):
+            nfev = self.nfev
+            result = super()._step_impl()
+            if self.nrejected != None: # every attempted step evaluates all stages
+                self.nrejected += max(0, (self.nfev - nfev)//self.n_stages - 1)
+            return result
+    return CountingSolver, solvers
+
+
+def _readSection(filename, offset, length, serializer): # unpickle one section of a .lag file
+    with open(filename, 'rb') as infile:
+        infile.seek(offset)
+        value = infile.read(length)
+    if serializer == "dill":
+        import dill
+        dill.settings["recurse"] = True
+        return dill.loads(value)
+    return pickle.loads(value)
+
+
+_SYMPLECTIC = ["verlet", "leapfrog", "yoshida4", "yoshida6"] # fixed step methods in integrators for separable systems
+_LAG_MAGIC = b"SYMPHYSICS-LAG\n" # start of .lag files from version 4, followed by the table of contents
+_LAG_SECTIONS = {"functions": ["coords", "coords1", "motion", "motion1", "constraints", "L", "massMatrix"],
+                 "lambdas": ["motionApply", "motionParams", "constantValues"],
+                 "data": ["trajectory", "data", "times"]} # attributes set by each section of a .lag file
+_LAG_DEFAULTS = {"motionParams": [], "constantValues": ()} # values of section attributes in a blank system, the rest are None
+
+class _LRUCache(): # dictionary holding at most maxsize items, the least recently used are removed first
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        self.items.move_to_end(key) # mark as most recently used
+        return self.items[key]
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize: # evict least recently used
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items.clear()
+
+
+class _VectorFunction():
+    # evaluates a list of expressions in a single numpy call, returning a contiguous array of results
+    # the function is generated as python source so it is pickled as source rather than as a dill closure
+    def __init__(self, args, expressions, name="_vector", shape=None): # expressions flattened in row major order if shape given
+        self.name = name
+        shape = (len(expressions),) if shape == None else tuple(shape)
+        symbols = [sp.Symbol("y_" + str(j)) for j in range(len(args))] # plain symbols as args may be functions of t
+        expressions = [sp.sympify(j).xreplace(dict(zip(args, symbols))) for j in expressions]
+        replacements, reduced = sp.cse(expressions, symbols=sp.numbered_symbols("_x")) # common subexpressions across all equations
+        printer = NumPyPrinter()
+        lines = ["def " + name + "(" + ", ".join(str(j) for j in symbols) + "):"]
+        for symbol, expr in replacements:
+            lines.append("    " + str(symbol) + " = " + printer.doprint(expr))
+        zeros = any(j == 0 for j in reduced) # zero entries are not assigned, e.g. in sparse jacobians
+        lines.append("    _out = numpy." + ("zeros" if zeros else "empty") + "(" + str(shape) + " + numpy.shape(" + str(symbols[0]) + "))") # broadcast to shape of args
+        for num, expr in enumerate(reduced):
+            if expr != 0:
+                lines.append("    _out[" + ", ".join(str(j) for j in np.unravel_index(num, shape)) + "] = " + printer.doprint(expr))
+        lines.append("    return _out")
+        self.source = "\n".join(lines)
+        self._compile()
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def rhs(self, y, params): # evaluate at a single state y with constants params
+        return self.func(*y, *params)
+
+    def _compile(self):
+        namespace = {"numpy": np}
+        exec(self.source, namespace)
+        self.func = namespace[self.name]
+
+    def __getstate__(self): # only store the source, function is recompiled on load
+        return {"name": self.name, "source": self.source}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+
+class _MassMatrixFunction():
+    # evaluates the first order system by solving the matrix equation A x = B for the second derivatives numerically
+    # A and B are evaluated together in one vectorized function, so it also works for batches of states
+    def __init__(self, args, n, matrixA, matrixB, backend="numpy"):
+        self.n = n # number of coordinates, args start with the coords then their velocities
+        self.size = matrixA.shape[0] # coordinates plus lagrange multipliers
+        if backend == "c":
+            from symphysics.codegen import compiledFunction
+            self.terms = compiledFunction(args, list(matrixA) + list(matrixB), name="_mass_matrix")
+        else:
+            self.terms = _VectorFunction(args, list(matrixA) + list(matrixB), name="_mass_matrix")
+
+    def __call__(self, *args):
+        terms = self.terms(*args)
+        shape = terms.shape[1:] # batch shape
+        matrixA = np.moveaxis(terms[:self.size**2].reshape((self.size, self.size) + shape), [0, 1], [-2, -1])
+        matrixB = np.moveaxis(terms[self.size**2:], 0, -1)
+        solution = np.linalg.solve(matrixA, matrixB[..., None])[..., 0]
+        out = np.empty((2*self.n,) + shape)
+        out[:self.n] = args[self.n:2*self.n] # first derivatives are the velocities
+        out[self.n:] = np.moveaxis(solution[..., :self.n], -1, 0)
+        return out
+
+    def rhs(self, y, params): # evaluate at a single state y with constants params
+        return self(*y, *params)
+
 
 class SystemL():
-    def __init__(self, L=None, coords=None,constraints=[] ,LU=True, diagnostic=False):
+    derivationMemo = _LRUCache(4096) # intermediate results of derivations shared by all systems, so small changes to a system only rederive what changed
+
+    def __init__(self, L=None, coords=None,constraints=[] ,LU=True, diagnostic=False, cache=None, simplify="full", timeout=None, processes=None, solve="symbolic"):
         #init variables - all set to None by default as that is what partially loaded systems have
         ###FUNCTIONS
         self.L = None
@@ -52,64 +255,521 @@ class SystemL():
         self.motion = None
         self.coords1 = None # [coords] + [coords time derivatives]
         self.motion1 = None
+        self.massMatrix = None # [A, B] with A coords1 second derivatives = B if solved numerically
         ###LAMBDAS
         self.motionApply = None
+        self.motionParams = [] # constant symbols passed to motionApply after coords1
+        self.constantValues = () # numerical values of motionParams
+        self.lambdaCache = _LRUCache(8) # lambdified functions keyed by the constants substituted into them
+        self.cacheKey = None # key of the equations in an EquationCache
+        self._lambdaKey = None
+        self._jacobianApply = None
         ###DATA
         self.data = None
         self.times = None
+        self.solution = None # result of solve_ivp including dense output and events
+        self.stats = None # statistics of the most recent solve
+        ###PROFILING
+        self.timings = {} # seconds taken by each stage of the most recent update, funcLambdify and solve
+        self.profile = False # count and time every evaluation of the equations of motion during solves, reported in stats
+        self.progress = None # function called with a dict after each stage and every progressInterval seconds of a solve
+        self.progressInterval = 10
+        self.trajectory = None # on disk Trajectory the data was loaded from
         if L != None and coords != None:
-            self.update(L, coords,constraints ,LU, diagnostic)
+            self.update(L, coords,constraints ,LU, diagnostic, cache, simplify, timeout, processes, solve)
     
     #function 1 in sequence (must be called by init or individually)
-    def update(self, L, coords, constraints=[],LU=True, diagnostic=False): # LU default to false as cannot simplify -  when fixed do time test TODO
+    def update(self, L, coords, constraints=[],LU=True, diagnostic=False, cache=None, simplify="full", timeout=None, processes=None, solve="symbolic"): # LU default to false as cannot simplify -  when fixed do time test TODO
         self.start = perf_counter()
-        diag_data = []
+        self._stageStart = self.start
+        self.timings = {}
         if diagnostic:
-            print("printing times for system creation in s\ntimes are cumulative")
+            print("printing times for system creation in s")
+        self._discardSections(["functions", "lambdas"]) # replaced, so never read from a .lag file
         self.L = L # Langrangian of system
         self.coords = coords # Coordinate variables, dynamicsymbols - function of "t"
         self.constraints = constraints # store contstraint expressions, which should equal 0
-        if LU:
-            self._calcLU(diagnostic, diag_data) # 2nd order equations by LU decomposition - better for higher degree of freedoms
+        self.motionApply = None # lambdas of any previous equations no longer valid
+        self.lambdaCache.clear()
+        if cache == True: # use the default cache location
+            cache = EquationCache()
+        stored = None
+        if cache:
+            self.cacheKey = cache.key(L, coords, constraints, LU, simplify, timeout, solve)
+            stored = cache.get(self.cacheKey)
+        if stored != None: # equations already derived
+            self.__dict__.update(stored)
+            self._stage("cache", diagnostic, "equations loaded from cache")
+        elif LU:
+            self._calcLU(diagnostic, simplify, timeout, processes, solve) # 2nd order equations by LU decomposition - better for higher degree of freedoms
         else:
+            if solve != "symbolic":
+                raise Exception("solve=" + str(solve) + " requires LU=True")
             self._calc()  # 2nd order equations of motion by gaussian elimination
             self._compress() # reduce to a set of 1st order ODEs
+        if cache and stored == None: # store for next time
+            cache.put(self.cacheKey, {"coords1": self.coords1, "motion": self.motion, "motion1": self.motion1, "massMatrix": self.massMatrix, "L_multipliers": self.L_multipliers})
+        self.timings["update"] = perf_counter()-self.start
         if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("equations compressed: " + str(diag_data[-1]))
-        ###### CHECK NEW VARIABLES DON'T INTERFERE WITH SAVING
-        for i in diag_data:
-            print(i)
+            print("equations of motion calculated: " + str(self.timings["update"]))
+
+    def _stage(self, name, diagnostic=False, message=None): # record the time since the last stage of update finished
+        now = perf_counter()
+        self.timings[name] = now - self._stageStart
+        self._stageStart = now
+        if diagnostic:
+            print((message if message != None else name) + ": " + str(self.timings[name]))
+        if self.progress != None:
+            self.progress({"event": "stage", "stage": name, "duration": self.timings[name]})
     
     #function 2 in sequence (optional) - can be called from ODEsolve
-    def funcLambdify(self, constants):
-        if self.motion1 == None or self.coords1 == None:
+    def funcLambdify(self, constants, vectorize=True, partial=False, backend="numpy"):
+        start = perf_counter()
+        if (self.motion1 == None and self.massMatrix == None) or self.coords1 == None:
             raise Exception("missing required variables, have lagrangian and coordinates been provided or loaded from file?")
-        self.motionApply = [j.rhs for j in self.motion1][:len(self.coords1)] # get RHS of equations
-        self.motionApply = self.subConstants(constants, self.motionApply, differentiate=True)
-        self.motionApply = [sp.lambdify(self.coords1, j, "numpy") for j in self.motionApply]
+        constants = list(constants.items()) if isinstance(constants, dict) else list(constants)
+        if partial: # substitute every constant - slower to create but can simplify the functions
+            substitutions = constants
+        else: # only substitute constants that are functions or expressions, numerical constants become arguments
+            substitutions = [j for j in constants if not (j[0].is_Symbol and sp.sympify(j[1]).is_Number)]
+        if backend not in ["numpy", "c"]:
+            raise Exception("unknown backend " + str(backend) + ", should be 'numpy' or 'c'")
+        key = (tuple(sorted((sp.srepr(j[0]), sp.srepr(sp.sympify(j[1]))) for j in substitutions)), vectorize, backend)
+        if key not in self.lambdaCache and self.motion1 == None: # mass matrix and forcing vector, solved numerically
+            matrixA, matrixB = [sp.ImmutableMatrix(self.subConstants(substitutions, list(j), differentiate=True)).reshape(*j.shape) for j in self.massMatrix]
+            params = sorted((matrixA.free_symbols | matrixB.free_symbols) - {t}, key=str) # remaining constants
+            self.lambdaCache.put(key, (_MassMatrixFunction(self.coords1 + params, len(self.coords), matrixA, matrixB, backend), params))
+        elif key not in self.lambdaCache: # no functions for this set of substitutions yet
+            motionRHS = [j.rhs for j in self.motion1][:len(self.coords1)] # get RHS of equations
+            motionRHS = self.subConstants(substitutions, motionRHS, differentiate=True)
+            params = sorted(set().union(*[sp.sympify(j).free_symbols for j in motionRHS]) - {t}, key=str) # remaining constants
+            if backend == "c": # compiled, falls back to numpy if there is no compiler
+                from symphysics.codegen import compiledFunction
+                motionApply = compiledFunction(self.coords1 + params, motionRHS)
+            elif vectorize: # one function for the whole first order system
+                motionApply = _VectorFunction(self.coords1 + params, motionRHS)
+            else: # one lambda per equation
+                motionApply = [sp.lambdify(self.coords1 + params, j, "numpy") for j in motionRHS]
+            self.lambdaCache.put(key, (motionApply, params))
+        self._discardSections(["lambdas"])
+        self.motionApply, self.motionParams = self.lambdaCache.get(key)
+        if len(constants) > 0 or len(self.motionParams) == 0:
+            self.constantValues = self._constantVector(constants)
+        else: # all constants as arguments, values given when solving
+            self.constantValues = ()
+        self._lambdaKey = (key, substitutions) # to create related functions with the same substitutions
+        self.timings["lambdify"] = perf_counter()-start
+
+    def _constantVector(self, constants): # numerical values for motionParams, from 2-tuples or already in order
+        if len(constants) > 0 and isinstance(constants[0], (tuple, list)) and isinstance(constants[0][0], sp.Basic):
+            values = dict(constants)
+            missing = [str(j) for j in self.motionParams if j not in values]
+            if len(missing) > 0:
+                raise Exception("no values given for constants: " + ", ".join(missing))
+            return tuple(float(values[j]) for j in self.motionParams)
+        values = np.asarray(constants, dtype=float)
+        if np.shape(values)[-1:] != (len(self.motionParams),) and not (len(self.motionParams) == 0 and values.size == 0):
+            raise Exception("expected values for " + str(len(self.motionParams)) + " constants in the order " + str(self.motionParams) + ", got shape " + str(np.shape(values)))
+        if values.ndim == 1:
+            return tuple(values)
+        return values # batch of constants, one row per state
+
+    def _useConstants(self, constants): # lambdify if needed, then set the constant values for a solve
+        if isinstance(constants, dict) or (constants is not None and len(constants) > 0 and isinstance(constants[0], (tuple, list)) and isinstance(constants[0][0], sp.Basic)):
+            if self.motion1 == None and self.massMatrix == None and self.motionApply is not None: # only lambdas e.g. loaded from a file
+                self.constantValues = self._constantVector(list(constants.items()) if isinstance(constants, dict) else constants)
+            else:
+                self.funcLambdify(constants) # cached, so no symbolic work unless the substituted functions change
+        elif self.motionApply is None: # constants as numerical values
+            if constants is None: # require coords even if an empty list
+                raise Exception("No constants provided, functions not yet lambdified")
+            self.funcLambdify([])
+            self.constantValues = self._constantVector(constants)
+        elif constants is not None:
+            self.constantValues = self._constantVector(constants)
     
     #function 3 in sequence
-    def ODESolve(self, initial, times, constants = None, diagnostic=False): # solves ODE over a time period - initials = [coords1 values]
-        if self.motionApply == None: # If lambidification not done do it now
-            if constants == None: # require coords even if an empty list
-                raise Exception("No constants provided, functions not yet lambdified")
-            self.funcLambdify(constants)
+    def ODESolve(self, initial, times, constants = None, diagnostic=False, method="odeint", rtol=None, atol=None, events=None, dense_output=False, substeps=1, jacobian="auto", blocks=False): # solves ODE over a time period - initials = [coords1 values]
+        from scipy.integrate import odeint, solve_ivp # scipy imported when first used, to keep importing symphysics fast
+        self._useConstants(constants) # lambdify if not done and set constant values
+        if np.ndim(self.constantValues) > 1:
+            raise Exception("a batch of constants requires ODESolveBatch")
         self.start = perf_counter() # times total time
-        self._final_t = times[-1] # stores final time of times for percentage calculation
-        self.start1 = perf_counter()# times pecentage calculation
-        self.data = odeint(self._eval, initial, times) # solve ode with _eval function to get derivatives
+        rhs, counts = self._instrument(self._eval, times[0], times[-1], diagnostic)
+        tolerances = {j: k for j, k in [("rtol", rtol), ("atol", atol)] if k != None}
+        mode = self._jacobianMode(method, jacobian)
+        self._jacobianApply = None # only created if the integrator uses it
+        if blocks: # independent or one way coupled parts of the system integrated separately
+            if method not in ["RK23", "RK45", "DOP853", "Radau", "BDF", "LSODA"] or events != None:
+                raise Exception("blocks require a solve_ivp method e.g. 'RK45' or 'LSODA', without events")
+            if dense_output:
+                raise Exception("dense_output is not available with blocks, each block is integrated with its own steps")
+            self.data, self.stats, counts = self._solveBlocks(method, initial, times, tolerances, mode, diagnostic)
+            self.solution = None
+        elif method == "odeint":
+            if events != None:
+                raise Exception("events require a solve_ivp method e.g. 'RK45' or 'LSODA'")
+            self.data, info = odeint(rhs, initial, times, Dfun=self._evalJacobian if mode == "analytic" else None, full_output=True, **tolerances) # solve ode with _eval function to get derivatives
+            self.solution = None
+            self.stats = {"method": method, "nfev": int(info["nfe"][-1]), "njev": int(info["nje"][-1]), "nlu": None, "nsteps": int(info["nst"][-1]), "nrejected": None}
+        elif method in ["RK23", "RK45", "DOP853", "Radau", "BDF", "LSODA"]:
+            solver, instances = _countingSolver(method)
+            events = [self.createEvent(j) if isinstance(j, sp.Basic) else j for j in events] if events != None else None
+            # dense output always used to find data at times, as solve_ivp does with t_eval, so accepted steps can be counted
+            if mode == "analytic":
+                tolerances["jac"] = self._evalJacobianIVP
+            elif mode == "sparse": # finite differences of grouped columns
+                tolerances["jac_sparsity"] = self.jacobianSparsity()
+            self.solution = solve_ivp(lambda t_local, y: rhs(y, t_local), (times[0], times[-1]), initial, method=solver, dense_output=True, events=events, **tolerances)
+            if self.solution.status == -1:
+                raise Exception("integration failed: " + self.solution.message)
+            times = np.asarray(times)
+            if self.solution.status == 1: # a terminal event stopped integration early
+                direction = np.sign(times[-1]-times[0]) # times may decrease
+                times = times[direction*times <= direction*self.solution.t[-1]]
+            self.data = self.solution.sol(times).T
+            self.stats = {"method": method, "nfev": int(self.solution.nfev), "njev": int(self.solution.njev), "nlu": int(self.solution.nlu), "nsteps": len(self.solution.t)-1, "nrejected": instances[0].nrejected}
+            if not dense_output:
+                self.solution.sol = None
+        elif method in _SYMPLECTIC:
+            self.data, self.stats = self._symplectic(method, initial, times, substeps)
+            self.solution = None
+        else:
+            raise Exception("unknown method " + str(method) + ", should be 'odeint', 'RK23', 'RK45', 'DOP853', 'Radau', 'BDF', 'LSODA', " + ", ".join("'" + j + "'" for j in _SYMPLECTIC))
+        self._solved(counts)
         if diagnostic:
             print("data created: " + str(perf_counter()-self.start))
         self.times = times # store times that corresponds with data
         return self.data
 
+    def _jacobianMode(self, method, jacobian): # "analytic", "sparse" or None for how the integrator method is given the jacobian
+        if jacobian not in ["auto", True, False, "sparse"]:
+            raise Exception("unknown jacobian " + str(jacobian) + ", should be 'auto', True, False or 'sparse'")
+        analytic = jacobian in ["auto", True] and self.motion1 != None and self._lambdaKey != None # derived from the equations of motion
+        if jacobian == True and not analytic:
+            raise Exception("analytic jacobian requires the symbolic equations of motion and lambdified functions")
+        equations = self.motion1 != None or self.massMatrix != None # needed by jacobianSparsity
+        if jacobian == "sparse" and method not in ["Radau", "BDF"]:
+            raise Exception("jacobian='sparse' requires the 'Radau' or 'BDF' method, the other methods can't use a sparsity pattern")
+        if jacobian == "sparse" and not equations:
+            raise Exception("sparse jacobian requires the equations of motion or mass matrix, not only lambdified functions")
+        if analytic and method in ["odeint", "LSODA", "Radau", "BDF"]:
+            return "analytic"
+        if jacobian in ["auto", "sparse"] and method in ["Radau", "BDF"] and equations:
+            return "sparse"
+        return None
+
+    def dependencyBlocks(self): # lists of indices of coords1 which must be integrated together, each after the blocks it depends on
+        from scipy.sparse.csgraph import connected_components
+        sparsity = self.jacobianSparsity() # sparsity[i, j] if the derivative of coords1[i] depends on coords1[j]
+        count, labels = connected_components(sparsity, directed=True, connection="strong")
+        blocks = [list(np.flatnonzero(labels == j)) for j in range(count)]
+        depends = [set(labels[np.flatnonzero(sparsity[j].any(axis=0))]) - {k} for k, j in enumerate(blocks)]
+        ordered = [] # topological order of the condensation, blocks with no dependencies first
+        while len(ordered) < count:
+            ready = [j for j in range(count) if j not in ordered and depends[j] <= set(ordered)]
+            ordered += ready
+        return [[int(k) for k in blocks[j]] for j in ordered]
+
+    def _solveBlocks(self, method, initial, times, tolerances, jacobian=None, diagnostic=False): # each block of dependencyBlocks with its own solve_ivp step control, returns data, stats and counts
+        from scipy.integrate import solve_ivp
+        if self.motion1 == None or self._lambdaKey == None:
+            raise Exception("blocks require the symbolic equations of motion and lambdified functions")
+        if isinstance(self.motionApply, list):
+            raise Exception("blocks require vectorized lambdified functions")
+        sparsity = self.jacobianSparsity()
+        initial = np.array(initial, dtype=float)
+        state = initial.copy() # state of every block at the time of the current evaluation
+        data = np.empty((len(times), len(state)))
+        solved = [] # (dense output, indices) of blocks already integrated
+        stats = {"method": method, "nfev": 0, "njev": 0, "nlu": 0, "nsteps": 0, "nrejected": 0, "blocks": []}
+        current = [None] # rhs of the block being integrated, instrumented once so counts cover every block
+        evaluate, counts = self._instrument(lambda y, t_local: current[0](t_local, y), times[0], times[-1], diagnostic)
+        for block in self.dependencyBlocks():
+            key = ("block", tuple(block)) + self._lambdaKey[0]
+            if key not in self.lambdaCache:
+                blockRHS = self.subConstants(self._lambdaKey[1], [self.motion1[j].rhs for j in block], differentiate=True)
+                self.lambdaCache.put(key, _VectorFunction(self.coords1 + self.motionParams, blockRHS, name="_block"))
+            function = self.lambdaCache.get(key)
+            needed = set(np.flatnonzero(sparsity[block].any(axis=0)))
+            upstream = [(sol, indices) for sol, indices in solved if needed & set(indices)] # blocks this one depends on
+            def setState(t_local, y, block=block, upstream=upstream):
+                state[block] = y
+                for sol, indices in upstream:
+                    state[indices] = sol(t_local)
+            def rhs(t_local, y, setState=setState, function=function):
+                setState(t_local, y)
+                return function(*state, *self.constantValues)
+            options = dict(tolerances)
+            if jacobian == "analytic": # rows and columns of the block in the whole jacobian
+                def jac(t_local, y, setState=setState, columns=np.ix_(block, block)):
+                    setState(t_local, y)
+                    return self._evalJacobian(state, t_local)[columns]
+                options["jac"] = jac
+            elif jacobian == "sparse":
+                options["jac_sparsity"] = sparsity[np.ix_(block, block)]
+            current[0] = rhs
+            solver, instances = _countingSolver(method)
+            solution = solve_ivp(lambda t_local, y: evaluate(y, t_local), (times[0], times[-1]), initial[block], method=solver, dense_output=True, **options)
+            if solution.status == -1:
+                raise Exception("integration failed: " + solution.message)
+            data[:, block] = solution.sol(times).T
+            solved.append((solution.sol, block))
+            blockStats = {"states": block, "nfev": int(solution.nfev), "njev": int(solution.njev), "nlu": int(solution.nlu), "nsteps": len(solution.t)-1, "nrejected": instances[0].nrejected}
+            stats["blocks"].append(blockStats)
+            for j in ["nfev", "njev", "nlu", "nsteps", "nrejected"]:
+                stats[j] = stats[j] + blockStats[j] if stats[j] != None and blockStats[j] != None else None
+        return data, stats, counts
+
+    def _symplectic(self, method, initial, times, substeps): # fixed step symplectic integration, returns data and stats
+        if self.isSeparable() == False:
+            raise Exception("symplectic methods require accelerations which only depend on the coordinates, e.g. L = T(velocities) + V(coordinates)")
+        n = len(self.coords1)//2 if self.coords1 != None else np.shape(initial)[-1]//2
+        calls = [0]
+        if self.motion != None and self._lambdaKey != None: # function of the coordinates only
+            key = ("accelerations",) + self._lambdaKey[0]
+            if key not in self.lambdaCache:
+                accelRHS = self.subConstants(self._lambdaKey[1], [j.rhs for j in self.motion[:n]], differentiate=True)
+                self.lambdaCache.put(key, _VectorFunction(self.coords + self.motionParams, accelRHS, name="_accelerations"))
+            function = self.lambdaCache.get(key)
+            params = tuple(np.transpose(self.constantValues)) # columns if one row of constants per state
+            def accel(q): # q is a single state or one row per state
+                calls[0] += 1
+                return function(*q.T, *params).T
+        else:
+            def accel(q): # accelerations are independent of the velocities, so evaluate with them as zero
+                calls[0] += 1
+                return self._evalBatch(np.concatenate((q, np.zeros_like(q)), axis=-1))[..., n:]
+        data = getattr(integrators, method)(accel, initial, times, substeps)
+        stats = {"method": method, "nfev": calls[0], "njev": 0, "nlu": 0, "nsteps": (len(times)-1)*substeps, "nrejected": 0}
+        return data, stats
+
+    def jacobianFunction(self): # compiled jacobian of the first order system with respect to coords1, in terms of coords1 and motionParams
+        if self.motion1 == None or self._lambdaKey == None:
+            raise Exception("jacobian requires the symbolic equations of motion and lambdified functions")
+        key = ("jacobian",) + self._lambdaKey[0]
+        if key not in self.lambdaCache:
+            symbols = [sp.Dummy() for j in self.coords1] # differentiate with respect to plain symbols
+            motionRHS = self.subConstants(self._lambdaKey[1], [j.rhs for j in self.motion1][:len(self.coords1)], differentiate=True)
+            motionRHS = sp.Matrix([sp.sympify(j).xreplace(dict(zip(self.coords1, symbols))) for j in motionRHS])
+            jac = motionRHS.jacobian(symbols)
+            self.lambdaCache.put(key, _VectorFunction(symbols + self.motionParams, list(jac), name="_jacobian", shape=jac.shape))
+        return self.lambdaCache.get(key)
+
+    def jacobianSparsity(self): # boolean array, True where an entry of the jacobian may be non zero
+        n = len(self.coords1)//2
+        if self.motion1 != None:
+            motionRHS = [sp.sympify(j.rhs) for j in self.motion1][:2*n]
+            return np.array([[j.has(k) for k in self.coords1] for j in motionRHS])
+        if self.massMatrix == None:
+            raise Exception("missing required variables, have lagrangian and coordinates been provided or loaded from file?")
+        sparsity = np.zeros((2*n, 2*n), dtype=bool)
+        sparsity[np.arange(n), np.arange(n, 2*n)] = True # velocities
+        terms = list(self.massMatrix[0]) + list(self.massMatrix[1]) # every acceleration depends on all of A and B
+        sparsity[n:] = [any(sp.sympify(j).has(k) for j in terms) for k in self.coords1]
+        return sparsity
+
+    def _evalJacobian(self, y, t_local):
+        if self._jacobianApply == None: # created on first use, non-stiff problems may never need it
+            self._jacobianApply = self.jacobianFunction()
+        return self._jacobianApply(*y, *self.constantValues)
+
+    def _evalJacobianIVP(self, t_local, y):
+        return self._evalJacobian(y, t_local)
+
+    def isSeparable(self): # True if the accelerations depend only on the coordinates, None if unknown
+        velocities = self.coords1[len(self.coords1)//2:] if self.coords1 != None else []
+        if self.motion != None:
+            exprs = [j.rhs for j in self.motion[:len(velocities)]]
+        elif self.massMatrix != None:
+            exprs = list(self.massMatrix[0]) + list(self.massMatrix[1])
+        else: # equations not available e.g. only lambdas loaded from file
+            return None
+        return not any(sp.sympify(j).has(*velocities) for j in exprs)
+
+    def energy(self, constants=None, data=None): # total energy sum(qdot*dL/dqdot) - L at each state of data
+        if self.L == None:
+            raise Exception("missing lagrangian, has it been provided or loaded from file?")
+        n = len(self.coords)
+        velocities = [(self.coords[j].diff(t), self.coords1[n+j]) for j in range(n)]
+        expr = sum(j.diff(t)*self.L.diff(j.diff(t)) for j in self.coords) - self.L
+        expr = self.subConstants(velocities, [expr])[0]
+        params = sorted(expr.free_symbols - {t}, key=str)
+        values = dict(zip(self.motionParams, self.constantValues)) if np.ndim(self.constantValues) == 1 else {}
+        values.update(dict(constants) if constants != None else {})
+        missing = [str(j) for j in params if j not in values]
+        if len(missing) > 0:
+            raise Exception("no values given for constants: " + ", ".join(missing))
+        data = np.asarray(self.data if data is None else data)
+        function = _VectorFunction(self.coords1 + params, [expr], name="_energy")
+        return function(*np.moveaxis(data, -1, 0), *[float(values[j]) for j in params])[0]
+
+    def createEvent(self, expr, terminal=False, direction=0): # event for ODESolve when expr, in terms of coords1 and constants, crosses zero
+        if self.motionApply == None:
+            raise Exception("functions not yet lambdified, events are created in terms of their constants")
+        function = _VectorFunction(self.coords1 + self.motionParams, [expr], name="_event")
+        def event(t_local, y):
+            return function(*y, *self.constantValues)[0]
+        event.terminal = terminal # stop integration when event occurs
+        event.direction = direction # only detect crossings from negative to positive if > 0 or positive to negative if < 0
+        return event
+
+    def ODESolveStream(self, initial, t_end, dt, chunk=1000, constants = None, method="LSODA", rtol=None, atol=None, t_start=0, jacobian="auto"): # generator of (times, data) blocks every dt until t_end
+        import scipy.integrate
+        self._useConstants(constants) # lambdify if not done and set constant values
+        if np.ndim(self.constantValues) > 1:
+            raise Exception("a batch of constants requires ODESolveBatch")
+        if method not in ["RK23", "RK45", "DOP853", "Radau", "BDF", "LSODA"]:
+            raise Exception("unknown method " + str(method) + ", should be 'RK23', 'RK45', 'DOP853', 'Radau', 'BDF' or 'LSODA'")
+        if dt <= 0 or t_end <= t_start:
+            raise Exception("require dt > 0 and t_end > t_start")
+        self.start = perf_counter()
+        rhs, counts = self._instrument(self._eval, t_start, t_end)
+        options = {j: k for j, k in [("rtol", rtol), ("atol", atol)] if k != None}
+        self._jacobianApply = None
+        mode = self._jacobianMode(method, jacobian)
+        if mode == "analytic":
+            options["jac"] = self._evalJacobianIVP
+        elif mode == "sparse":
+            options["jac_sparsity"] = self.jacobianSparsity()
+        solver = getattr(scipy.integrate, method)(lambda t_local, y: rhs(y, t_local), t_start, np.asarray(initial, dtype=float), t_end, **options)
+        count = int(np.floor((t_end - t_start)/dt + 1e-9)) + 1 # number of output times
+        times = np.empty(chunk) # only one chunk of data is held at a time
+        data = np.empty((chunk, len(initial)))
+        times[0] = t_start
+        data[0] = initial
+        filled = 1
+        sample = 1 # index of next output time
+        steps = 0
+        while sample < count:
+            if filled == chunk: # pass on a full chunk
+                yield times.copy(), data.copy()
+                filled = 0
+            sample_t = min(t_start + sample*dt, t_end) # rounding may put the last output time just past t_end
+            if solver.t < sample_t and solver.status != "finished": # integrate past next output time
+                message = solver.step()
+                if solver.status == "failed":
+                    raise Exception("integration failed: " + str(message))
+                steps += 1
+                interpolant = solver.dense_output()
+                continue
+            times[filled] = sample_t
+            data[filled] = interpolant(min(sample_t, solver.t))
+            filled += 1
+            sample += 1
+        if filled > 0:
+            yield times[:filled].copy(), data[:filled].copy()
+        self.stats = {"method": method, "nfev": int(solver.nfev), "njev": int(solver.njev), "nlu": int(solver.nlu), "nsteps": steps, "nrejected": None}
+        self._solved(counts)
+
+    def ODESolveBatch(self, initials, times, constants = None, method="rk45", substeps=1, rtol=1e-6, atol=1e-9, diagnostic=False): # solves for many initial conditions at once - initials = [[coords1 values], ...]
+        self._useConstants(constants) # lambdify if not done and set constant values, may be one row per initial
+        self.start = perf_counter() # times total time
+        initials = np.asarray(initials, dtype=float)
+        if np.ndim(self.constantValues) > 1: # one set of constants per initial, broadcast initials if only one given
+            initials = np.broadcast_to(initials, (len(self.constantValues), initials.shape[-1]))
+        counts = {"calls": 0, "time": 0.0} # one call per step for the whole batch
+        def evalBatch(y):
+            before = perf_counter()
+            result = self._evalBatch(y)
+            counts["calls"] += 1
+            counts["time"] += perf_counter() - before
+            return result
+        if method == "rk4": # fixed step, substeps steps between each time
+            data = integrators.rk4(evalBatch, initials, times, substeps)
+            self.stats = {"method": method, "nfev": counts["calls"], "njev": 0, "nlu": 0, "nsteps": (len(times)-1)*substeps, "nrejected": 0}
+        elif method == "rk45": # adaptive step
+            data = integrators.rk45(evalBatch, initials, times, rtol, atol)
+            self.stats = {"method": method, "nfev": counts["calls"], "njev": 0, "nlu": 0, "nsteps": None, "nrejected": None}
+        elif method in _SYMPLECTIC: # fixed step for separable systems
+            data, self.stats = self._symplectic(method, initials, times, substeps)
+            counts = None # accelerations are not evaluated through _evalBatch
+        else:
+            raise Exception("unknown method " + str(method) + ", should be 'rk4', 'rk45', " + ", ".join("'" + j + "'" for j in _SYMPLECTIC))
+        self.solution = None
+        self.data = np.ascontiguousarray(np.swapaxes(data, 0, 1)) # reorder to (batch, time, state)
+        self._solved(counts if self.profile else None)
+        if diagnostic:
+            print("data created: " + str(perf_counter()-self.start))
+        self.times = times # store times that corresponds with data
+        return self.data
+
+    def runMany(self, tasks, workers=None, method="odeint", rtol=None, atol=None, substeps=1, chunksize=1): # generator of (index, data) for (initial, constants, times) tasks solved by a pool of processes
+        if self.motionApply is None: # every constant is an argument, so tasks can use any values
+            self.funcLambdify([])
+        tasks = [(initial, self._constantVector(self.constantValues if constants is None else constants), np.asarray(times, dtype=float)) for initial, constants, times in tasks]
+        if any(np.ndim(j[1]) > 1 for j in tasks):
+            raise Exception("a batch of constants requires ODESolveBatch")
+        start = perf_counter()
+        offsets = np.concatenate(([0], np.cumsum([len(j[2]) for j in tasks])))
+        shape = (int(offsets[-1]), len(self.coords1) if self.coords1 != None else np.shape(tasks[0][0])[-1])
+        # results are written by the workers into a memory mapped file, in ram if possible, rather than pickled back
+        folder = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        handle, path = tempfile.mkstemp(prefix="symphysics-", suffix=".bin", dir=folder)
+        os.close(handle)
+        out = np.memmap(path, dtype=float, mode='w+', shape=shape)
+        worker = SystemL() # only what is needed to solve, so the symbolic equations aren't sent to every worker
+        worker.coords1, worker.motionApply, worker.motionParams, worker.constantValues = self.coords1, self.motionApply, self.motionParams, self.constantValues
+        options = {"method": method, "rtol": rtol, "atol": atol, "substeps": substeps}
+        stats = []
+        try:
+            with multiprocessing.Pool(workers, initializer=_initRunMany, initargs=(worker, path, shape, options)) as pool:
+                for index, length, taskStats in pool.imap_unordered(_runManyTask, [(j,) + tasks[j] + (offsets[j],) for j in range(len(tasks))], chunksize):
+                    stats.append(taskStats)
+                    if self.progress != None:
+                        self.progress({"event": "task", "index": index, "completed": len(stats), "tasks": len(tasks), "elapsed": perf_counter()-start})
+                    yield index, out[offsets[index]:offsets[index]+length]
+        finally:
+            try:
+                os.remove(path) # the mapping stays valid until the arrays are deleted
+            except OSError: # can't remove a mapped file on windows
+                pass
+        if all(len(j[2]) == len(tasks[0][2]) for j in tasks): # (task, time, state) like ODESolveBatch
+            self.data = out.reshape((len(tasks), len(tasks[0][2]), shape[1]))
+            self.times = tasks[0][2]
+        else:
+            self.data = [out[offsets[j]:offsets[j+1]] for j in range(len(tasks))]
+            self.times = [j[2] for j in tasks]
+        self.stats = {"method": method, "tasks": len(tasks), "nfev": sum(j["nfev"] for j in stats), "nsteps": sum(j["nsteps"] for j in stats), "wall_time": perf_counter()-start}
+
+    def _evalBatch(self, y): # evaluate time derivatives for an array of states, one row per state
+        if isinstance(self.motionApply, list): # lambda per equation - as saved by older versions
+            return np.array(np.broadcast_arrays(*[j(*y.T, *np.transpose(self.constantValues)) for j in self.motionApply])).T
+        return self.motionApply(*y.T, *np.transpose(self.constantValues)).T
+
+    def _instrument(self, function, t_start, t_end, diagnostic=False): # function(y, t) wrapped to count and time calls and report progress, only if needed
+        report = self.progress
+        if report == None and diagnostic: # print the percentage complete
+            report = lambda info: print(str(round(100*info["fraction"], 2)) + "%")
+        if not self.profile and report == None: # nothing added to each evaluation
+            return function, None
+        counts = {"calls": 0, "time": 0.0}
+        start = perf_counter()
+        following = [start + self.progressInterval] # time of the next report
+        def instrumented(y, t_local):
+            before = perf_counter()
+            result = function(y, t_local)
+            after = perf_counter()
+            counts["calls"] += 1
+            counts["time"] += after - before
+            if report != None and after > following[0]:
+                following[0] = after + self.progressInterval
+                report({"event": "solve", "t": t_local, "fraction": (t_local - t_start)/(t_end - t_start), "elapsed": after - start, "rhs_calls": counts["calls"]})
+            return result
+        return instrumented, counts
+
+    def _solved(self, counts): # complete stats and timings at the end of a solve
+        self.stats["wall_time"] = perf_counter()-self.start
+        self.timings["solve"] = self.stats["wall_time"]
+        if counts != None:
+            self.stats.update({"rhs_calls": counts["calls"], "rhs_time": counts["time"], "time_per_call": counts["time"]/max(counts["calls"], 1)})
+        if self.progress != None:
+            self.progress(dict(self.stats, event="solved"))
+
     def _eval(self, y, t_local):
-        if perf_counter() - self.start1 > 10:
-            self.start1 = perf_counter()
-            print(str(round(100*t_local/self._final_t, 2)) + "%")
-        temp = [j(*y) for j in self.motionApply] # evaluate time derivatives at point
-        return temp
+        if isinstance(self.motionApply, list): # lambda per equation - as saved by older versions
+            return [j(*y, *self.constantValues) for j in self.motionApply] # evaluate time derivatives at point
+        return self.motionApply.rhs(y, self.constantValues)
     
     def _calc(self): # DEPRECIATED
         self.L_multipliers = [sp.Symbol("lambda_" + str(j) + "_mult") for j in range(len(self.constraints))]
@@ -130,24 +790,19 @@ class SystemL():
             result.append(sp.Eq(([i.diff(t, 2) for i in self.coords] + self.L_multipliers)[num], sp.simplify(expr)))
         self.motion = result
     
-    def _calcLU(self, diagnostic, diag_data):
+    def _calcLU(self, diagnostic, simplify="full", timeout=None, processes=None, solve="symbolic"):
+        from sympy.physics.mechanics import dynamicsymbols # slow to import, only needed when deriving
         #create enough lagrange multipliers for constraints
         self.L_multipliers = [sp.Symbol("lambda_" + str(j) + "_mult") for j in range(len(self.constraints))]
         L_prime = self.L # stores lagrangian with constraints
         for j in range(len(self.constraints)):
             L_prime += self.L_multipliers[j]*self.constraints[j]
-        eq = euler_equations(L_prime, self.coords, t) # extract euler lagrange equations
+        eq = self._eulerLagrange(L_prime) # extract euler lagrange equations
         eq += [sp.Eq(j.diff(t,2) ,0) for j in self.constraints] # add constraint equations in second t deriv. form
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("Euler-Lagrange equations calculated: " + str(diag_data[-1]))
+        self._stage("euler_lagrange", diagnostic, "Euler-Lagrange equations calculated")
 
-        eq = [sp.simplify(j) for j in eq] # simplify equations
-        eq = [sp.trigsimp(j) for j in eq]
-        eq = [sp.factor(j) for j in eq]
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("Euler-Lagrange equations simplified: " + str(diag_data[-1]))
+        eq = self._simplifyMemo(eq, simplify, timeout, processes, [j.diff(t,2) for j in self.coords]) # simplify equations
+        self._stage("simplify", diagnostic, "Euler-Lagrange equations simplified")
         if False in eq:
             raise Exception("Lagrangian appears to be inconsistent")
 
@@ -162,28 +817,66 @@ class SystemL():
             placeholders += [(j.diff(t,2), new), (j.diff(t), new_o)]
             seconds.append(new)
         eq = self.subConstants(placeholders, eq)
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("derivatives substituted: " + str(diag_data[-1]))
+        self._stage("substitute", diagnostic, "derivatives substituted")
         matrixA, matrixB = sp.linear_eq_to_matrix(eq, seconds + self.L_multipliers) # set up equations as a matrix equation
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("Matrix equation created: " + str(diag_data[-1]))
-        solution = matrixA.LUsolve(matrixB) # solve matrix equation
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("matrix equation solved: " + str(diag_data[-1]))
+        self._stage("matrix", diagnostic, "Matrix equation created")
+        if solve == "numeric": # matrix equation solved at each step instead
+            self.massMatrix = [sp.ImmutableMatrix(matrixA), sp.ImmutableMatrix(matrixB)]
+            self.motion = None
+            self.motion1 = None
+            return
+        elif solve != "symbolic":
+            raise Exception("unknown solve " + str(solve) + ", should be 'symbolic' or 'numeric'")
+        self.massMatrix = None
+        blocks = _matrixBlocks(matrixA) # coordinates which don't share any entry of matrixA are solved separately
+        keys = [("LUsolve", sp.ImmutableMatrix(matrixA.extract(rows, columns)), sp.ImmutableMatrix(matrixB.extract(rows, [0]))) for rows, columns in blocks]
+        results = {j: SystemL.derivationMemo.get(j) for j in keys if j in SystemL.derivationMemo}
+        missing = list(dict.fromkeys(j for j in keys if j not in results))
+        if processes != None and processes > 1 and len(missing) > 1:
+            with multiprocessing.Pool(processes) as pool:
+                solved = pool.starmap(_luSolve, [j[1:] for j in missing])
+        else:
+            solved = [_luSolve(*j[1:]) for j in missing]
+        for key, result in zip(missing, solved):
+            SystemL.derivationMemo.put(key, result)
+            results[key] = result
+        solution = [None]*matrixA.cols
+        for (rows, columns), key in zip(blocks, keys):
+            for column, expr in zip(columns, results[key]):
+                solution[column] = expr
+        self._stage("solve", diagnostic, "matrix equation solved")
         # add validation / ability for non-linear systems
         result = []
         for num, expr in enumerate(solution[:]): # recreate equations
             result.append(sp.Eq(([self.coords1[len(self.coords)+j].diff(t) for j in range(len(self.coords))] + self.L_multipliers)[num], expr)) # simplify(expr) breaks for double conical??? TODO
         self.motion = result
         self.motion1 = [sp.Eq(self.coords[j].diff(t), self.coords1[len(self.coords)+j]) for j in range(len(self.coords))] + self.motion
-        if diagnostic:
-            diag_data.append(perf_counter()-self.start)
-            print("results appended and derivatives reapplied: " + str(diag_data[-1]))
+        self._stage("equations", diagnostic, "results appended and derivatives reapplied")
     
+    def _eulerLagrange(self, L_prime): # euler_equations, summed from the memoized contribution of each term of L_prime
+        order = max([len(j.variables) for j in L_prime.atoms(sp.Derivative) if j.expr in self.coords] + [0])
+        totals = [0 for j in self.coords]
+        for term in sp.Add.make_args(L_prime):
+            for j in range(len(self.coords)):
+                key = ("euler", term, self.coords[j], order)
+                if key not in SystemL.derivationMemo: # dL/dq - d/dt(dL/dqdot) + ... as in euler_equations
+                    contribution = sp.diff(term, self.coords[j])
+                    for i in range(1, order+1):
+                        contribution = contribution + sp.S.NegativeOne**i*sp.diff(term, sp.diff(self.coords[j], (t, i)), (t, i))
+                    SystemL.derivationMemo.put(key, contribution)
+                totals[j] += SystemL.derivationMemo.get(key)
+        eqs = [sp.Eq(j, 0) for j in totals]
+        return [j for j in eqs if isinstance(j, sp.Eq)] # equations which are identically true are dropped
+
+    def _simplifyMemo(self, eqs, strategy, timeout, processes, variables): # _simplifyEquations, only for equations not already simplified
+        keys = [("simplify", j, strategy, timeout, tuple(variables)) for j in eqs]
+        missing = [j for j in range(len(eqs)) if keys[j] not in SystemL.derivationMemo]
+        for j, result in zip(missing, _simplifyEquations([eqs[j] for j in missing], strategy, timeout, processes, variables)):
+            SystemL.derivationMemo.put(keys[j], result)
+        return [SystemL.derivationMemo.get(j) for j in keys]
+
     def _compress(self): # DEPRECIATED
+        from sympy.physics.mechanics import dynamicsymbols
         self.coords1 = copy.copy(self.coords) # set up list of coords
         self.motion1 = [] # set up blank list of good equations
         for q in self.coords: # for all coords
@@ -206,92 +899,181 @@ class SystemL():
     
     @staticmethod
     def saveSystem(sys, filename, functions=False, lambdas=True, datas=True): # saves system
-        stores = {} # dictionary stores data
-        stores["version"] = 1 # version number of lag file - to ensure program backwards compatible
-        if functions: # if stroing functions
-            funcColl = [sys.coords, sys.coords1, sys.motion, sys.motion1, sys.constraints, [sys.L]]
-            funcColl = [copy.copy(j) for j in funcColl] # make copy so as not to disturb original system
+        import dill
+        toc = {"version": 4, "sections": {}} # table of contents - version number of lag file to ensure program backwards compatible
+        sections = [] # pickled sections, each read only when needed on load
+        target = pathlib.Path(filename + '.lag').resolve() # the same file may be named by a relative or absolute path
+        for section, entry in list(sys.__dict__.get("_lazy", {}).items()):
+            if section != "data" and pathlib.Path(entry[0]).resolve() == target and any(j not in sys.__dict__ for j in _LAG_SECTIONS[section]):
+                sys._loadSection(section) # read before the file is overwritten
+        if not isinstance(sys, SystemL): # another type of system e.g. SystemN, pickled without its data
+            sections.append(("system", "pickle", sys))
+        elif functions: # if stroing functions
+            funcColl = [sys.coords, sys.coords1, sys.motion, sys.motion1, sys.constraints, [sys.L], sys.massMatrix]
+            funcColl = [copy.copy(j) if j != None else [] for j in funcColl] # make copy so as not to disturb original system
             funcColl, convs = SystemL._convertFunctions(funcColl) # convert functions to symbols
-            stores["functions"] = funcColl # store functions
-            stores["fileConversions"] = convs # store data to reconstruct functions from symbols
-        if lambdas and sys.motionApply != None: # if want to store lambda functions and they exist
-            stores["lambdas"] = sys.motionApply
-        if datas and isinstance(sys.data, np.ndarray): # if want to store data and it exists
-            stores["data"] = sys.data
-            stores["times"] = sys.times
-        #base_path = pathlib.Path(__file__).parent # get main path of workspace
+            sections.append(("functions", "dill", [funcColl, convs])) # store functions with data to reconstruct functions from symbols
+        if lambdas and isinstance(sys, SystemL) and sys.motionApply != None: # if want to store lambda functions and they exist
+            # vectorized functions pickle as their source and are recompiled on load, lists of lambdas need dill
+            serializer = "dill" if isinstance(sys.motionApply, list) else "pickle"
+            sections.append(("lambdas", serializer, [sys.motionApply, sys.motionParams, sys.constantValues]))
+        if datas and isinstance(sys.data, np.ndarray): # if want to store data and it exists, it goes in a trajectory alongside the .lag file
+            data, axis = sys.data, 0
+            if data.ndim == 3: # batch solutions are (batch, time, state), trajectories are stored time first
+                data, axis = np.swapaxes(data, 0, 1), 1
+            # written beside the old trajectory then swapped in, as the data may be memory mapped from it
+            path = pathlib.Path(filename + '.lagdata')
+            temp, old = path.with_name(path.name + '.tmp'), path.with_name(path.name + '.old')
+            for j in [temp, old]:
+                shutil.rmtree(j, ignore_errors=True)
+            Trajectory(temp, data.shape[1:]).append(sys.times, data)
+            if path.exists():
+                os.replace(path, old)
+            os.replace(temp, path)
+            shutil.rmtree(old, ignore_errors=True) # mappings of the old files stay valid
+            toc["trajectory"] = pathlib.Path(filename).name + '.lagdata' # relative to the .lag file
+            toc["trajectoryAxis"] = axis
+        offset = 0
+        for j in range(len(sections)):
+            name, serializer, value = sections[j]
+            if serializer == "dill":
+                dill.settings["recurse"] = True
+                value = dill.dumps(value)
+            else:
+                value = pickle.dumps(value)
+            toc["sections"][name] = {"offset": offset, "length": len(value), "serializer": serializer}
+            sections[j] = value
+            offset += len(value)
+        toc = json.dumps(toc).encode()
         filename += '.lag'
-        #file_path = str((base_path / "../saved systems/"/filename).resolve())
-        #outfile = open(file_path, 'wb')
-        outfile = open(filename, 'wb')
-        dill.settings["recurse"] = True
-        dill.dump(stores, outfile) # dill the system store into a .lag file
-        outfile.close()
+        with open(filename, 'wb') as outfile: # header, table of contents then sections
+            outfile.write(_LAG_MAGIC + len(toc).to_bytes(8, "little") + toc)
+            for j in sections:
+                outfile.write(j)
     
     @staticmethod
-    def loadSystem(filename):
-        #base_path = pathlib.Path(__file__).parent # get main path of workspace
+    def loadSystem(filename): # only the table of contents is read, sections are loaded when their attributes are first used
+        import dill
         filename += '.lag'
-        #file_path = str((base_path / "../saved systems/"/filename).resolve())
-        #infile = open(file_path, 'rb')
-        infile = open(filename, 'rb')
-        dill.settings["recurse"] = True
-        stores = dill.load(infile) # un-dill the system store
-        infile.close()
         sys = SystemL() # create a blank system
-        if stores["version"] > 1: # check program can handle version number
+        with open(filename, 'rb') as infile:
+            if infile.read(len(_LAG_MAGIC)) != _LAG_MAGIC: # version 3 and below dill everything together
+                infile.seek(0)
+                dill.settings["recurse"] = True
+                stores = dill.load(infile) # un-dill the system store
+                if stores["version"] > 3: # check program can handle version number
+                    raise Exception("file version number exceeds maximum - please update your symlagrange")
+                if "functions" in stores:
+                    sys._setFunctions(stores["functions"], stores["fileConversions"])
+                if "lambdas" in stores: # if ambda functions sotred retrieve them
+                    sys.motionApply = stores["lambdas"]
+                    if "constants" in stores: # version 1 lambdas have constants substituted
+                        sys.motionParams, sys.constantValues = stores["constants"]
+                if "data" in stores: # version 2 and below pickle the data in the .lag file
+                    sys.data = stores["data"]
+                    sys.times = stores["times"]
+                if "trajectory" in stores:
+                    sys._setTrajectory(pathlib.Path(filename).parent / stores["trajectory"], stores["trajectoryAxis"])
+                return sys
+            length = int.from_bytes(infile.read(8), "little")
+            toc = json.loads(infile.read(length))
+        if toc["version"] > 4: # check program can handle version number
             raise Exception("file version number exceeds maximum - please update your symlagrange")
-        if "functions" in stores: # if the function is stored
-            funcs = SystemL._loadFunctions(stores["functions"], stores["fileConversions"]) # unconvert functions
-            sys.coords = funcs[0] # load correct functions into system
-            sys.coords1 = funcs[1]
-            sys.motion = funcs[2]
-            sys.motion1 = funcs[3]
-            sys.constraints = funcs[4]
-            sys.L = funcs[5][0] # sys.L packaged as [sys.L] for function conversions
-        if "lambdas" in stores: # if ambda functions sotred retrieve them
-            sys.motionApply = stores["lambdas"]
-        if "data" in stores: # if data stored retrieve them and corresponding times
-            sys.data = stores["data"]
-            sys.times = stores["times"]
+        start = len(_LAG_MAGIC) + 8 + length
+        if "system" in toc["sections"]: # not a SystemL, read whole
+            entry = toc["sections"]["system"]
+            sys = _readSection(filename, start + entry["offset"], entry["length"], entry["serializer"])
+            if "trajectory" in toc:
+                SystemL._setTrajectory(sys, pathlib.Path(filename).parent / toc["trajectory"], toc["trajectoryAxis"])
+            return sys
+        sys._lazy = {}
+        for name, entry in toc["sections"].items():
+            sys._lazy[name] = (filename, start + entry["offset"], entry["length"], entry["serializer"])
+        if "trajectory" in toc:
+            sys._lazy["data"] = (pathlib.Path(filename).parent / toc["trajectory"], toc["trajectoryAxis"])
+        for name in sys._lazy: # remove defaults so that __getattr__ is used to load them
+            for attribute in _LAG_SECTIONS[name]:
+                delattr(sys, attribute)
         return sys # return the system
 
-    
+    def __getattr__(self, name): # only called for missing attributes, i.e. sections of a .lag file which haven't been loaded
+        lazy = self.__dict__.get("_lazy", {})
+        for section in list(lazy):
+            if name in _LAG_SECTIONS[section]:
+                self._loadSection(section)
+                return getattr(self, name)
+        raise AttributeError("'SystemL' object has no attribute '" + name + "'")
+
+    def __setattr__(self, name, value): # a section of a .lag file is read before any of its attributes is replaced, so it can't later overwrite the new value
+        lazy = self.__dict__.get("_lazy")
+        if lazy:
+            for section in [j for j in lazy if name in _LAG_SECTIONS[j]]:
+                self._loadSection(section)
+        object.__setattr__(self, name, value)
+
+    def _discardSections(self, sections): # sections of a .lag file about to be replaced whole, their attributes reset to those of a blank system without reading them
+        lazy = self.__dict__.get("_lazy", {})
+        for section in [j for j in sections if j in lazy]:
+            del lazy[section]
+            for attribute in _LAG_SECTIONS[section]:
+                if attribute not in self.__dict__:
+                    object.__setattr__(self, attribute, copy.copy(_LAG_DEFAULTS.get(attribute)))
+
+    def _loadSection(self, section): # read one section of a .lag file
+        entry = self._lazy.pop(section)
+        if section == "data":
+            self._setTrajectory(*entry)
+            return
+        value = _readSection(*entry)
+        if section == "functions":
+            self._setFunctions(*value)
+        elif section == "lambdas":
+            self.motionApply, self.motionParams, self.constantValues = value
+
+    def _setFunctions(self, funcs, conversions):
+        funcs = SystemL._loadFunctions(funcs, conversions) # unconvert functions
+        self.coords = funcs[0] # load correct functions into system
+        self.coords1 = funcs[1]
+        self.motion = funcs[2]
+        self.motion1 = funcs[3]
+        self.constraints = funcs[4]
+        self.L = funcs[5][0] # sys.L packaged as [sys.L] for function conversions
+        self.massMatrix = None
+        if len(funcs) > 6 and len(funcs[6]) > 0: # solved numerically, no motion equations
+            self.massMatrix = funcs[6]
+            self.motion = None
+            self.motion1 = None
+
+    def _setTrajectory(self, path, axis): # data memory mapped from the trajectory, only read from disk when used
+        self.trajectory = Trajectory(path)
+        self.times = self.trajectory.times
+        self.data = self.trajectory.data
+        if axis == 1:
+            self.data = np.swapaxes(self.data, 0, 1)
+
     @staticmethod
-    def _convertFunctions(funcs): # currently only works if no functions which aren't coords
-        # in line below list of lists compressed into a list
+    def _convertFunctions(funcs): # replace undefined functions with symbols, in one pass over each expression
         functions = _get_func_from_iter(functools.reduce(list.__add__, funcs)) # get a list of tuples of functions and their replacments and function and symbol arguments
-        conversions = [[j[0], j[1]] for j in functions] # get function and replacement symbols
-        fileConversions = [[j[1], SystemL.subConstants(conversions, j[2]), j[3]] for j in functions] # save function symbols and their function and symbol arguments
-        for i in range(len(conversions)): # convert all functions to symbols - done 1 at a time so functions changed in other functions are still recognised
-            const = [conversions[i]]
-            funcs = [SystemL.subConstants(const, j) for j in funcs]
-            for j in range(len(conversions)):
-                conversions[j] = SystemL.subConstants(const, conversions[j]) # change conversions so function arguments match those found, see above
+        conversions = {j[0]: j[1] for j in functions}
+        # save function symbols, their function and symbol arguments, and all arguments in order (older files don't have these)
+        fileConversions = [[j[1], [k.xreplace(conversions) for k in j[2]], j[3], [k.xreplace(conversions) for k in j[0].args]] for j in functions]
+        # xreplace replaces the outermost match, so functions nested in other functions are converted with them
+        funcs = [[sp.sympify(k).xreplace(conversions) for k in j] for j in funcs]
         return funcs, fileConversions
     
     @staticmethod
-    def _loadFunctions(funcs, fileConversions):
-        conversions = [] # list function conversions from symbols
-        while len(fileConversions) > 0: #while functions still to be converted from symbols
-            loop_conversions = [] # stores conversions within this loop
-            removes = [] # items to be removed after for loop
-            for j in fileConversions: # for each remaining function to be converted
-                if len(j[1]) == 0: # check all arguments of function whichare also functions have already been restored j[1] is unrestored function symbols
-                    temp = (j[0], sp.Function(j[0].name[:len(j[0].name)-5])(*j[2]))
-                    conversions.append(temp) # if so add to conversions the restored functin and arguments
-                    loop_conversions.append(temp)
-                    removes.append(j)
-            for j in removes: # rmove resotred functions from list
-                fileConversions.remove(j)
-            removes = []
-            for j in range(len(fileConversions)): # convert all functions in list which have just been restored and are arguments to another function
-                sys.fileConversions[j][1] = SystemL.subConstants(loop_conversions, fileConversions[j][1])
-                for k in fileConversions[j][1]: # all restored argument functions are moved from j[1] to j[2]
-                    if k.is_Function:
-                        fileConversions[j][2].append(k)
-                        removes.append(k)
-                for k in removes:
-                    fileConversions[j][1].remove(k)
-        funcs = [SystemL.subConstants(conversions, j) for j in funcs] # return a list of converted functions
-        return funcs
+    def _loadFunctions(funcs, fileConversions): # fileConversions as from _convertFunctions
+        conversions = {} # symbols and the functions they are restored to
+        remaining = list(fileConversions)
+        while len(remaining) > 0: # restore functions once all of their function arguments have been restored
+            ready = [j for j in remaining if all(k in conversions or not k.is_Symbol for k in j[1])]
+            if len(ready) == 0:
+                raise Exception("could not restore functions: " + ", ".join(str(j[0]) for j in remaining))
+            for j in ready:
+                if len(j) > 3:
+                    args = [k.xreplace(conversions) for k in j[3]]
+                else: # restored function arguments follow the symbol arguments
+                    args = list(j[2]) + [k.xreplace(conversions) for k in j[1]]
+                conversions[j[0]] = sp.Function(j[0].name[:len(j[0].name)-5])(*args)
+            remaining = [j for j in remaining if j[0] not in conversions]
+        return [[sp.sympify(k).xreplace(conversions) for k in j] for j in funcs] # return a list of converted functions
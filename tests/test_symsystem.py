@@ -0,0 +1,415 @@
+import sympy as sp
+import numpy as np
+from sympy.physics.mechanics import dynamicsymbols
+from symphysics import SystemL, Trajectory
+
+t = sp.symbols("t")
+m, g, l = sp.symbols('m, g, l')
+consts = [(m, 1), (l, 1), (g, 9.81)]
+
+def double_pendulum(**kwargs):
+    a, b = dynamicsymbols('alpha, beta')
+    x1, y1 = l*sp.sin(a), -l*sp.cos(a)
+    x2, y2 = x1 + l*sp.sin(b), y1 - l*sp.cos(b)
+    L = m*(x1.diff(t)**2 + y1.diff(t)**2 + x2.diff(t)**2 + y2.diff(t)**2)/2 - m*g*(y1 + y2)
+    return SystemL(L, [a, b], **kwargs)
+
+def test_batch_matches_single():
+    sys = double_pendulum()
+    times = np.linspace(0, 2, 21)
+    initials = np.random.default_rng(0).uniform(-1, 1, (5, 4))
+    data = sys.ODESolveBatch(initials, times, consts, rtol=1e-10, atol=1e-10)
+    assert data.shape == (5, 21, 4)
+    fixed = sys.ODESolveBatch(initials, times, method="rk4", substeps=20)
+    for num, initial in enumerate(initials):
+        single = sys.ODESolve(initial, times)
+        assert np.allclose(data[num], single, atol=1e-5)
+        assert np.allclose(fixed[num], single, atol=1e-5)
+    backwards = sys.ODESolveBatch(data[:, -1], times[::-1], rtol=1e-10, atol=1e-10) # integrated back to the initial states
+    assert np.allclose(backwards[:, -1], initials, atol=1e-5)
+
+def test_constants_as_arguments():
+    sys = double_pendulum()
+    times = np.linspace(0, 1, 11)
+    initial = [0.5, -0.5, 0, 0]
+    sys.funcLambdify([(m, 1), (l, 2), (g, 9.81)], partial=True)
+    assert sys.motionParams == []
+    partial = sys.ODESolve(initial, times)
+    sys.funcLambdify(consts)
+    assert [str(j) for j in sys.motionParams] == ["g", "l", "m"]
+    assert np.allclose(sys.ODESolve(initial, times, [9.81, 2, 1]), partial)
+    batch = sys.ODESolveBatch(initial, times, [[9.81, 2, 1], [9.81, 1, 1]], rtol=1e-10, atol=1e-10)
+    assert np.allclose(batch[0], partial, atol=1e-5)
+    assert np.allclose(batch[1], sys.ODESolve(initial, times, consts), atol=1e-5)
+
+def test_equation_cache(tmp_path):
+    from symphysics import EquationCache
+    cache = EquationCache(tmp_path)
+    first = double_pendulum(cache=cache)
+    assert cache.get(first.cacheKey) != None
+    second = double_pendulum(cache=cache)
+    assert second.motion1 == first.motion1
+    cache.invalidate(first.cacheKey)
+    assert cache.get(first.cacheKey) == None
+
+def test_simplify_strategies_match():
+    states = np.random.default_rng(1).uniform(-2, 2, (50, 4))
+    reference = double_pendulum()
+    reference.funcLambdify(consts)
+    expected = reference._evalBatch(states)
+    for strategy in ["none", "cheap", "trig"]:
+        sys = double_pendulum(simplify=strategy)
+        sys.funcLambdify(consts)
+        assert np.allclose(sys._evalBatch(states), expected, rtol=1e-10, atol=1e-12)
+    import signal, threading, warnings
+    from time import perf_counter
+    SystemL.derivationMemo.clear()
+    signal.setitimer(signal.ITIMER_REAL, 1000) # a timer of the caller, which is kept
+    start = perf_counter()
+    timed = double_pendulum(timeout=0.01)
+    assert perf_counter() - start < 3 # fully simplifying takes several seconds
+    assert 990 < signal.setitimer(signal.ITIMER_REAL, 0)[0] < 1000
+    timed.funcLambdify(consts)
+    assert np.allclose(timed._evalBatch(states), expected, rtol=1e-10, atol=1e-12)
+    pooled = double_pendulum(timeout=0.01, processes=2)
+    pooled.funcLambdify(consts)
+    assert np.allclose(pooled._evalBatch(states), expected, rtol=1e-10, atol=1e-12)
+    from symphysics.symsystem import _simplifyEquation
+    caught = []
+    def simplify():
+        with warnings.catch_warnings(record=True) as record:
+            warnings.simplefilter("always")
+            caught.append((_simplifyEquation(sp.Eq(sp.sin(t)**2 + sp.cos(t)**2, 1), "trig", timeout=1), len(record)))
+    thread = threading.Thread(target=simplify)
+    thread.start()
+    thread.join()
+    assert caught == [(True, 1)] # off the main thread, simplified without a timeout and warned
+
+def test_numeric_mass_matrix_matches_symbolic():
+    states = np.random.default_rng(2).uniform(-2, 2, (50, 4))
+    symbolic = double_pendulum(simplify="cheap")
+    symbolic.funcLambdify(consts)
+    numeric = double_pendulum(simplify="cheap", solve="numeric")
+    assert numeric.motion1 == None
+    numeric.funcLambdify(consts)
+    assert np.allclose(numeric._evalBatch(states), symbolic._evalBatch(states))
+    times = np.linspace(0, 1, 11)
+    assert np.allclose(numeric.ODESolve(states[0], times), symbolic.ODESolve(states[0], times))
+
+def test_solve_ivp_methods_and_events():
+    sys = double_pendulum(simplify="cheap")
+    times = np.linspace(0, 2, 21)
+    reference = sys.ODESolve([0.5, 0, 0, 0], times, consts, rtol=1e-10, atol=1e-10)
+    for method in ["RK45", "DOP853", "Radau", "LSODA"]:
+        data = sys.ODESolve([0.5, 0, 0, 0], times, method=method, rtol=1e-9, atol=1e-9)
+        assert np.allclose(data, reference, atol=1e-5)
+        assert sys.stats["method"] == method and sys.stats["nfev"] > 0
+    stop = sys.createEvent(sys.coords[0], terminal=True)
+    data = sys.ODESolve([0.5, 0, 0, 0], times, method="RK45", events=[stop])
+    assert len(sys.solution.t_events[0]) == 1
+    assert len(data) == len(sys.times) < len(times)
+    backwards = sys.ODESolve([0.5, 0, 0, 0], times[::-1], method="RK45", rtol=1e-10, atol=1e-10)
+    assert np.allclose(sys.times, times[::-1]) and np.allclose(backwards, sys.ODESolve([0.5, 0, 0, 0], times[::-1], rtol=1e-10, atol=1e-10), atol=1e-6)
+    stopped = sys.ODESolve([0.5, 0, 0, 0], -times, method="RK45", events=[stop])
+    assert len(stopped) == len(sys.times) < len(times) and sys.times[-1] >= sys.solution.t[-1]
+
+def test_symplectic_methods():
+    a = dynamicsymbols('theta')
+    pendulum = SystemL(m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a), [a])
+    assert pendulum.isSeparable()
+    times = np.linspace(0, 10, 101)
+    reference = pendulum.ODESolve([1, 0], times, consts, rtol=1e-10, atol=1e-10)
+    for method, substeps in [("verlet", 100), ("leapfrog", 100), ("yoshida4", 10), ("yoshida6", 5)]:
+        data = pendulum.ODESolve([1, 0], times, method=method, substeps=substeps)
+        assert np.allclose(data, reference, atol=1e-2)
+        energy = pendulum.energy(consts)
+        assert np.max(np.abs(energy - energy[0])) < 1e-3
+    batch = pendulum.ODESolveBatch([[1, 0], [0.5, 0]], times, method="yoshida4", substeps=10)
+    assert np.allclose(batch[0], pendulum.ODESolve([1, 0], times, method="yoshida4", substeps=10))
+    assert not double_pendulum(simplify="cheap").isSeparable()
+
+def test_analytic_jacobian():
+    sys = double_pendulum(simplify="cheap")
+    sys.funcLambdify(consts)
+    y = np.array([0.3, -0.2, 0.5, 0.1])
+    jac = sys.jacobianFunction()(*y, *sys.constantValues)
+    step = 1e-6
+    numeric = np.array([(sys._evalBatch(y + step*e) - sys._evalBatch(y - step*e))/(2*step) for e in np.eye(4)]).T
+    assert np.allclose(jac, numeric, atol=1e-6)
+    assert np.array_equal(sys.jacobianSparsity()[:2], [[False, False, True, False], [False, False, False, True]])
+    times = np.linspace(0, 1, 11)
+    analytic = sys.ODESolve(y, times, method="Radau", jacobian=True, rtol=1e-9, atol=1e-9)
+    assert sys.stats["njev"] > 0
+    assert np.allclose(analytic, sys.ODESolve(y, times, method="Radau", jacobian=False, rtol=1e-9, atol=1e-9), atol=1e-6)
+    assert np.allclose(analytic, sys.ODESolve(y, times, method="BDF", jacobian="sparse", rtol=1e-9, atol=1e-9), atol=1e-5)
+    import pytest
+    for method in ["odeint", "LSODA", "RK45"]: # can't use a sparsity pattern
+        with pytest.raises(Exception):
+            sys.ODESolve(y, times, method=method, jacobian="sparse")
+
+def test_c_backend(tmp_path, monkeypatch):
+    import pickle, pytest
+    monkeypatch.setenv("SYMPHYSICS_CACHE", str(tmp_path))
+    sys = double_pendulum(simplify="cheap")
+    states = np.random.default_rng(3).uniform(-2, 2, (50, 4))
+    sys.funcLambdify(consts)
+    expected = sys._evalBatch(states)
+    sys.funcLambdify(consts, backend="c")
+    assert np.allclose(sys._evalBatch(states), expected)
+    assert np.allclose(sys.motionApply.rhs(states[0], sys.constantValues), expected[0])
+    assert np.allclose(pickle.loads(pickle.dumps(sys.motionApply))(*states.T, *sys.constantValues).T, expected)
+    monkeypatch.setenv("SYMPHYSICS_CACHE", str(tmp_path / "empty")) # nothing already compiled
+    monkeypatch.setenv("CC", str(tmp_path / "missing-compiler"))
+    sys.lambdaCache.clear()
+    with pytest.warns(UserWarning):
+        sys.funcLambdify(consts, backend="c")
+    assert np.allclose(sys._evalBatch(states), expected)
+
+def test_stream_matches_solve():
+    sys = double_pendulum(simplify="cheap")
+    blocks = list(sys.ODESolveStream([0.5, 0, 0, 0], 2, 0.05, chunk=15, constants=consts, rtol=1e-10, atol=1e-10))
+    assert [len(j[0]) for j in blocks] == [15, 15, 11]
+    times = np.concatenate([j[0] for j in blocks])
+    data = np.concatenate([j[1] for j in blocks])
+    assert np.allclose(times, np.linspace(0, 2, 41))
+    assert np.allclose(data, sys.ODESolve([0.5, 0, 0, 0], times, rtol=1e-10, atol=1e-10), atol=1e-7)
+    for t_end in [0.3, 0.7]: # t_end/dt not exact in floating point, the last time rounds past t_end
+        times = np.concatenate([j[0] for j in sys.ODESolveStream([0.5, 0, 0, 0], t_end, 0.1, chunk=2)])
+        assert len(times) == round(t_end/0.1) + 1 and times[-1] == t_end
+
+
+def test_trajectory_storage(tmp_path):
+    sys = double_pendulum(simplify="cheap")
+    traj = Trajectory(tmp_path / "run.lagdata", 4).write(sys.ODESolveStream([0.5, 0, 0, 0], 2, 0.05, chunk=15, constants=consts))
+    assert traj.shape == (41, 4) and traj.header["chunks"] == 3
+    times, data = Trajectory(tmp_path / "run.lagdata").window(0.5, 1)
+    assert np.allclose(times, np.linspace(0.5, 1, 11))
+    assert np.allclose(data, traj.data[10:21])
+    sys.ODESolve([0.5, 0, 0, 0], np.linspace(0, 1, 21))
+    SystemL.saveSystem(sys, str(tmp_path / "pendulum"))
+    loaded = SystemL.loadSystem(str(tmp_path / "pendulum"))
+    assert isinstance(loaded.data, np.memmap)
+    assert np.array_equal(loaded.data, sys.data) and np.array_equal(loaded.times, sys.times)
+
+
+def test_lazy_load(tmp_path):
+    sys = double_pendulum(simplify="cheap")
+    sys.ODESolve([0.5, 0, 0, 0], np.linspace(0, 1, 21), constants=consts)
+    SystemL.saveSystem(sys, str(tmp_path / "pendulum"), functions=True)
+    loaded = SystemL.loadSystem(str(tmp_path / "pendulum"))
+    assert set(loaded._lazy) == {"functions", "lambdas", "data"}
+    assert np.array_equal(loaded.data, sys.data)
+    assert set(loaded._lazy) == {"functions", "lambdas"}
+    assert np.allclose(loaded.motionApply(0.5, 0, 0, 0, *loaded.constantValues), sys.motionApply(0.5, 0, 0, 0, *sys.constantValues))
+    assert set(loaded._lazy) == {"functions"}
+    assert len(loaded.coords) == 2 and not loaded._lazy
+
+
+def test_save_loaded_system(tmp_path, monkeypatch):
+    sys = double_pendulum(simplify="cheap")
+    data = sys.ODESolve([0.5, 0, 0, 0], np.linspace(0, 1, 21), constants=consts).copy()
+    SystemL.saveSystem(sys, str(tmp_path / "pendulum"), functions=True)
+    loaded = SystemL.loadSystem(str(tmp_path / "pendulum"))
+    loaded.data # memory mapped from the trajectory which is replaced
+    SystemL.saveSystem(loaded, str(tmp_path / "pendulum"), functions=True)
+    assert np.array_equal(loaded.data, data)
+    again = SystemL.loadSystem(str(tmp_path / "pendulum"))
+    assert np.array_equal(again.data, data) and len(again.coords) == 2
+    assert sorted(j.name for j in tmp_path.iterdir()) == ["pendulum.lag", "pendulum.lagdata"]
+    monkeypatch.chdir(tmp_path)
+    relative = SystemL.loadSystem("pendulum")
+    SystemL.saveSystem(relative, str(tmp_path / "pendulum")) # the same file by its absolute path
+    assert len(relative.coords) == 2 and relative.L == again.L
+
+
+def test_modify_loaded_system(tmp_path):
+    a, k = dynamicsymbols('x'), sp.Symbol('k')
+    sys = double_pendulum(simplify="cheap")
+    sys.funcLambdify(consts)
+    SystemL.saveSystem(sys, str(tmp_path / "system"), functions=True)
+    loaded = SystemL.loadSystem(str(tmp_path / "system"))
+    loaded.update(a.diff(t)**2/2 - k*a**2/2, [a], simplify="cheap")
+    assert loaded.motionParams == [] and loaded.constantValues == () # not the saved lambdas
+    loaded.funcLambdify([(k, 2)])
+    SystemL.saveSystem(loaded, str(tmp_path / "system"), functions=True)
+    again = SystemL.loadSystem(str(tmp_path / "system"))
+    assert again.L == loaded.L and again.constantValues == (2.0,) and len(again.coords) == 1
+    loaded = SystemL.loadSystem(str(tmp_path / "system"))
+    loaded.constantValues = (3.0,) # other attributes of the section are read first
+    SystemL.saveSystem(loaded, str(tmp_path / "system"))
+    again = SystemL.loadSystem(str(tmp_path / "system"))
+    assert again.constantValues == (3.0,) and again.motionParams == [k]
+
+
+
+def test_solve_loaded_lambdas(tmp_path):
+    sys = double_pendulum(simplify="cheap")
+    times = np.linspace(0, 1, 11)
+    data = sys.ODESolve([0.5, 0, 0, 0], times, constants=consts)
+    SystemL.saveSystem(sys, str(tmp_path / "pendulum")) # lambdas only
+    loaded = SystemL.loadSystem(str(tmp_path / "pendulum"))
+    assert np.allclose(loaded.ODESolve([0.5, 0, 0, 0], times, consts), data)
+
+
+def test_import_is_lazy():
+    import subprocess, sys as _sys
+    code = "import sys, symphysics; symphysics.SystemL; print(sorted(j for j in ['scipy', 'matplotlib', 'dill'] if j in sys.modules))"
+    result = subprocess.run([_sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_run_many():
+    sys = double_pendulum(simplify="cheap")
+    sys.funcLambdify([])
+    times = np.linspace(0, 2, 21)
+    tasks = [([0.1*j, 0, 0, 0], [9.81, 1, 1 + j], times) for j in range(4)] + [([0.5, 0, 0, 0], consts, times[:11])]
+    results = dict(sys.runMany(tasks, workers=2))
+    assert sorted(results) == list(range(5)) and sys.stats["tasks"] == 5
+    for j in range(5):
+        assert np.array_equal(results[j], sys.ODESolve(tasks[j][0], tasks[j][2], tasks[j][1]))
+
+
+def test_incremental_derivation(monkeypatch):
+    from symphysics import symsystem
+    k = sp.symbols("k")
+    sys = double_pendulum(simplify="cheap")
+    a, b = sys.coords
+    simplified = []
+    original = symsystem._simplifyEquation
+    def counting(eq, *args):
+        simplified.append(eq)
+        return original(eq, *args)
+    monkeypatch.setattr(symsystem, "_simplifyEquation", counting)
+    sys.update(sys.L + k*b**2, sys.coords, simplify="cheap") # only the equation for beta changes
+    assert len(simplified) == 1
+    SystemL.derivationMemo.clear()
+    fresh = SystemL(sys.L, sys.coords, simplify="cheap")
+    assert [sp.simplify(j.rhs - f.rhs) for j, f in zip(sys.motion, fresh.motion)] == [0, 0]
+
+
+def test_function_conversion():
+    from sympy.core.function import AppliedUndef
+    f, h = sp.Function("f"), sp.Function("h")
+    a = dynamicsymbols("alpha")
+    funcs = [[a, a.diff(t)], [sp.Eq(f(h(t), t)**2, sp.sin(a).diff(t)*h(t))], [], [l*f(h(t), t) + m*a]]
+    converted, conversions = SystemL._convertFunctions([list(j) for j in funcs])
+    assert not any(j.atoms(AppliedUndef) for k in converted for j in k)
+    assert SystemL._loadFunctions(converted, conversions) == funcs
+
+
+def test_profiling():
+    events = []
+    sys = SystemL()
+    sys.progress = events.append
+    pendulum = double_pendulum(simplify="cheap")
+    sys.update(pendulum.L, pendulum.coords, simplify="cheap")
+    assert {"euler_lagrange", "simplify", "matrix", "solve", "update"} <= set(sys.timings)
+    assert [j["stage"] for j in events[:2]] == ["euler_lagrange", "simplify"]
+    sys.profile = True
+    sys.progressInterval = 0
+    sys.ODESolve([0.5, 0, 0, 0], np.linspace(0, 1, 11), constants=consts, method="RK45")
+    assert sys.stats["rhs_calls"] == sys.stats["nfev"] and sys.stats["time_per_call"] > 0
+    assert any(j["event"] == "solve" for j in events) and events[-1]["event"] == "solved"
+    assert "lambdify" in sys.timings and "solve" in sys.timings
+    solve = sys.timings["solve"]
+    sys.ODESolveBatch([[0.5, 0, 0, 0], [0.2, 0, 0, 0]], np.linspace(0, 1, 11), method="rk4")
+    assert sys.stats["method"] == "rk4" and sys.stats["nfev"] == 40 and sys.stats["rhs_calls"] == 40
+    assert sys.timings["solve"] != solve and events[-1]["event"] == "solved" and events[-1]["method"] == "rk4"
+
+
+def test_nbody(tmp_path):
+    from symphysics import SystemN
+    rng = np.random.default_rng(0)
+    positions, masses = rng.normal(size=(200, 3)), rng.uniform(0.5, 1.5, 200)
+    direct = SystemN(masses, softening=0.01, force="direct")
+    tree = SystemN(masses, softening=0.01, force="tree", theta=0)
+    assert np.allclose(tree.accelerations(positions), direct.accelerations(positions))
+    assert np.allclose(tree.potentials(positions), direct.potentials(positions))
+    binary = SystemN([1, 1e-3], d=2)
+    data = binary.ODESolve([0, 0, 1, 0, 0, 0, 0, np.sqrt(1.001)], np.linspace(0, 4*np.pi, 201), method="yoshida4")
+    assert data.shape == (201, 8) and binary.stats["force"] == "direct"
+    assert np.allclose(np.linalg.norm(data[:, 2:4] - data[:, 0:2], axis=1), 1, atol=1e-4) # circular orbit
+    energy = binary.energy()
+    assert np.max(np.abs(energy - energy[0])) < 1e-8*abs(energy[0])
+    assert np.allclose(binary.momentum(), binary.momentum()[0])
+    SystemL.saveSystem(binary, str(tmp_path / "binary"))
+    loaded = SystemL.loadSystem(str(tmp_path / "binary"))
+    assert isinstance(loaded, SystemN) and np.array_equal(loaded.masses, binary.masses)
+    assert np.array_equal(loaded.data, data)
+
+
+def test_blocks():
+    a, b, x = dynamicsymbols('a, b, x')
+    L = m*l**2*a.diff(t)**2/2 + m*g*l*sp.cos(a) + m*l**2*b.diff(t)**2/2 + 4*m*g*l*sp.cos(b) + m*x.diff(t)**2/2
+    sys = SystemL(L, [a, b, x], simplify="cheap")
+    assert sys.motion[1].rhs == -4*g*sp.sin(b)/l
+    assert sys.dependencyBlocks() == [[0, 3], [1, 4], [5], [2]] # the position of the free particle after its velocity
+    times = np.linspace(0, 5, 51)
+    together = sys.ODESolve([1, 0.5, 0, 0, 0, 0.3], times, consts, method="RK45", rtol=1e-10, atol=1e-12)
+    separate = sys.ODESolve([1, 0.5, 0, 0, 0, 0.3], times, consts, method="RK45", rtol=1e-10, atol=1e-12, blocks=True)
+    assert np.allclose(together, separate, atol=1e-7)
+    assert len(sys.stats["blocks"]) == 4 and sys.stats["blocks"][0]["nfev"] < sys.stats["blocks"][1]["nfev"] # slower pendulum takes longer steps
+    sys.profile = True
+    stiff = sys.ODESolve([1, 0.5, 0, 0, 0, 0.3], times, method="Radau", rtol=1e-10, atol=1e-12, blocks=True)
+    assert np.allclose(together, stiff, atol=1e-6)
+    assert sys.stats["rhs_calls"] == sys.stats["nfev"] > 0 # every block is instrumented
+    analytic = sys.stats["nfev"]
+    sys.ODESolve([1, 0.5, 0, 0, 0, 0.3], times, method="Radau", rtol=1e-10, atol=1e-12, blocks=True, jacobian=False)
+    assert sys.stats["nfev"] > analytic # finite differences without the jacobian of each block
+    import pytest
+    with pytest.raises(Exception):
+        sys.ODESolve([1, 0.5, 0, 0, 0, 0.3], times, method="RK45", blocks=True, dense_output=True)
+
+
+def trails_scene(vectorized, d=2, limits=True): # particle on a circle with a trace and a fade, off screen with Agg
+    import matplotlib
+    matplotlib.use("Agg")
+    from symphysics import Animate
+    times = np.linspace(0, 3, 31)
+    data = np.stack((times, np.cos(times)), axis=1)
+    animator = Animate(data, times, d=d)
+    if limits:
+        animator.limits([-1.2, 1.2], [-1.2, 1.2], [-1.2, 1.2] if d == 3 else False)
+    if vectorized:
+        conv = lambda a: np.stack([np.cos(a[:, 0]), np.sin(a[:, 0])] + [a[:, 1]]*(d-2), axis=1)
+    else:
+        conv = lambda a: [np.cos(a[0]), np.sin(a[0])] + [a[1]]*(d-2)
+    p = animator.create_particle(data[0], conv, vectorized=vectorized)
+    animator.create_trace(p, 5)
+    animator.create_fade(p, 4)
+    return animator
+
+
+def test_trails_match_precomputed():
+    import matplotlib.pyplot as plt
+    for d in [2, 3]:
+        ring, precomputed = trails_scene(False, d), trails_scene(True, d)
+        assert ring.traces[0].positions is None and precomputed.traces[0].positions is not None
+        for j in range(1, 31):
+            ring.update(j)
+            precomputed.update(j)
+            assert np.allclose(ring.traces[0].traceCoords, precomputed.traces[0].traceCoords)
+            assert np.allclose(ring.fades[0].traceCoords, precomputed.fades[0].traceCoords)
+        plt.close("all")
+
+
+def test_seek_and_parallel_export(tmp_path):
+    import matplotlib.pyplot as plt
+    from PIL import Image, ImageSequence
+    for vectorized in [False, True]:
+        played, sought = trails_scene(vectorized), trails_scene(vectorized)
+        for j in range(1, 21):
+            played.update(j)
+        sought.update(7) # seek replaces any earlier state
+        sought.seek(20)
+        assert np.allclose(played.particles[0].position, sought.particles[0].position)
+        assert np.allclose(played.traces[0].traceCoords, sought.traces[0].traceCoords)
+        assert np.allclose(played.fades[0].traceCoords, sought.fades[0].traceCoords)
+    for limits in [True, False]: # autoscaled limits change the layout of the first draw
+        trails_scene(False, limits=limits).savegif(str(tmp_path / "serial"), 10)
+        trails_scene(False, limits=limits).savegif(str(tmp_path / "parallel"), 10, workers=2)
+        plt.close("all")
+        with Image.open(tmp_path / "serial.gif") as serial, Image.open(tmp_path / "parallel.gif") as parallel:
+            assert serial.n_frames == parallel.n_frames == (30 if limits else 1) # identical frames are merged
+            for a, b in zip(ImageSequence.Iterator(serial), ImageSequence.Iterator(parallel)): # the same pixels, including the first frame of each worker
+                assert np.array_equal(np.asarray(a.convert("RGB")), np.asarray(b.convert("RGB")))